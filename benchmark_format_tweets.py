@@ -0,0 +1,100 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - benchmark_format_tweets.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import time
+from datetime import datetime, timedelta
+from random import randint, random
+
+import pandas as pd
+
+from scraper.database.twitter_facade import _format_tweets, tweet_fields
+
+"""
+Benchmark of the formatting of a twint tweets_df into tweet documents, in rows per second.
+- before:   the row by row formatting that save_tweets used: apply(lambda), .apply(str), iterrows() and to_dict()
+- after:    the columnar formatting of twitter_facade._format_tweets
+No database is needed, only the formatting is timed.
+"""
+
+n_rows = 20000
+
+
+def make_tweets_df(n):
+    # A fake twint tweets_df with the columns that save_tweets uses
+    begin = datetime(2020, 1, 1)
+    rows = []
+    for i in range(n):
+        tweet_id = str(1200000000000000000 + i)
+        rows.append({'id': tweet_id,
+                     'conversation_id': tweet_id if random() < .7 else str(1100000000000000000 + i),
+                     'created_at': 1577836800000 + i,
+                     'date': (begin + timedelta(seconds=i * 37)).strftime('%Y-%m-%d %H:%M:%S'),
+                     'timezone': '+0200',
+                     'place': '',
+                     'tweet': 'Lorem ipsum dolor sit amet ' * 4,
+                     'hashtags': ['#vlaanderen'],
+                     'cashtags': [],
+                     'user_id': randint(10000, 99999),
+                     'username': 'SomeUser',
+                     'name': 'Some User',
+                     'day': 3,
+                     'hour': '12',
+                     'link': f'https://twitter.com/someuser/status/{tweet_id}',
+                     'retweet': False,
+                     'nlikes': randint(0, 500),
+                     'nreplies': randint(0, 50),
+                     'nretweets': randint(0, 100),
+                     'quote_url': '',
+                     'search': '',
+                     'near': '',
+                     'geo': '',
+                     'source': '',
+                     'user_rt_id': '',
+                     'user_rt': '',
+                     'retweet_id': '',
+                     'reply_to': [{'user_id': '11767', 'username': 'SomeUser'}, {'user_id': '12345', 'username': 'OtherUser'}],
+                     'retweet_date': '',
+                     'translate': '',
+                     'trans_src': '',
+                     'trans_dest': ''})
+    return pd.DataFrame(rows)
+
+
+def format_tweets_before(df):
+    df = df.rename(columns={'id': 'tweet_id'})
+    df['user_id'] = df['user_id'].apply(str)
+    df['username'] = df['username'].str.lower()
+
+    def f(lst):
+        for dct in lst:
+            dct['username'] = dct['username'].lower()
+
+    df['reply_to'].apply(lambda x: f(x))
+    df['is_reply'] = df['tweet_id'] != df['conversation_id']
+    df['datetime'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S')
+    df['date'] = df['datetime'].dt.date.apply(str)
+    df['time'] = df['datetime'].dt.time.apply(str)
+    df = df[tweet_fields]
+    return [row.to_dict() for _, row in df.iterrows()]
+
+
+def benchmark(format_function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        df = make_tweets_df(n_rows)  # A new df every time, format_tweets_before changes the reply_to dicts
+        start = time.perf_counter()
+        format_function(df)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return n_rows / best
+
+
+if __name__ == '__main__':
+    before = benchmark(format_tweets_before)
+    after = benchmark(_format_tweets)
+    print(f'{n_rows} tweets')
+    print(f'before: {before:12.0f} rows/s')
+    print(f'after:  {after:12.0f} rows/s')
+    print(f'speedup: {after / before:.1f}x')
@@ -9,6 +9,31 @@ DATABASE = 'test_full'
 # DATABASE = 'twitter_database'
 LOG_LEVEL = 'Debug'
 
+# Shared MongoClient (see scraper/database/db_client.py)
+MONGO_URI = 'mongodb://localhost:27017'
+MONGO_MAX_POOL_SIZE = 100  # Max nr of connections per process
+MONGO_COMPRESSORS = 'zlib'  # Wire compression: 'zlib', 'snappy' or 'zstd'. 'snappy' and 'zstd' need the python-snappy or zstandard package.
+MONGO_WRITE_CONCERN = 1  # 1: acknowledged by the primary, 'majority': by the majority of the replica set, 0: not acknowledged
+
+# Buffered scraping logs (see scraper/database/log_facade.py)
+LOG_SINK_MAX_BUFFER = 500  # Write the logs when this nr of logs is waiting...
+LOG_SINK_FLUSH_INTERVAL = 2  # ... or after this nr of seconds
+LOG_SINK_MAX_RETRY_INTERVAL = 30  # Max nr of seconds between the retries of writing a 'dead' log
+
+# Proxy usage stats are counted in memory and written every PROXY_STATS_FLUSH_INTERVAL seconds (see scraper/database/proxy_facade.py)
+PROXY_STATS_FLUSH_INTERVAL = 10
+
+# Proxy tests (see scraper/business/proxy_prober.py)
+PROXY_PROBE_TARGET = 'twitter.com:443'  # host:port that is requested through the proxies
+PROXY_PROBE_METHOD = 'CONNECT'  # 'CONNECT': a tunnel to the target, 'GET': a plain http request to the target
+PROXY_PROBE_TIMEOUT = 10  # Seconds to connect to the proxy and again to get the first byte of its answer
+PROXY_PROBE_CONCURRENCY = 1000  # Max nr of proxies tested at the same time
+
+# Proxy health monitor (see scraper/business/proxy_health_monitor.py)
+PROXY_MONITOR_INTERVAL = 60  # Seconds between two rounds of tests
+PROXY_MONITOR_BASE_INTERVAL = 3600  # Seconds after which a proxy is tested again. Used and failing proxies sooner, blacklisted ones later.
+PROXY_MONITOR_BATCH_SIZE = 2000  # Max nr of proxies tested in a round
+
 if __name__ == '__main__':
     pass
 
@@ -0,0 +1,164 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - proxy_harvester.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import sys
+from datetime import datetime
+
+import aiohttp
+from bs4 import BeautifulSoup
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+
+from tools.logger import logger
+
+"""
+Harvests proxy servers from the websites in the registry of proxy sources.
+All pages of all sources are fetched at the same time. The proxies are deduplicated in memory, so they can be saved with one bulk write.
+Pages that need javascript are rendered by a headless Firefox, in an executor, while the other pages are fetched.
+
+Adding a source:
+    class MySource(ProxySource):
+        name = 'my-source.com'
+        urls = ['https://my-source.com/proxies?page=1', ...]
+
+        def parse(self, html):
+            return [(ip, port), ...]
+
+    register_proxy_source(MySource())
+
+A source whose pages need javascript sets uses_browser = True and implements fetch(url), a blocking call that returns the rendered html.
+"""
+
+
+class ProxySource:
+    """
+    A website with lists of proxy servers. 'urls' are its pages, parse() gets the (ip, port)'s out of the html of a page.
+    The pages are fetched with aiohttp, unless 'uses_browser'. Then fetch() gets them.
+    """
+    name = ''
+    urls = []
+    uses_browser = False
+
+    def fetch(self, url):
+        raise NotImplementedError
+
+    def parse(self, html):
+        raise NotImplementedError
+
+
+class FreeProxyList(ProxySource):
+    name = 'free-proxy-list.net'
+    urls = ['https://free-proxy-list.net/']
+
+    def parse(self, html):
+        soup = BeautifulSoup(html, 'lxml')
+        table = soup.find('table', id='proxylisttable')
+        if table is None: return []
+        list_td = [tr.find_all('td') for tr in table.find_all('tr')]
+        return [(td[0].text, td[1].text) for td in list_td if len(td) > 1]
+
+
+class HideMyName(ProxySource):
+    # All countries except Australia. The table is filled by javascript, so the pages are rendered by a headless Firefox.
+    name = 'hidemy.name'
+    url = 'https://hidemy.name/en/proxy-list/?country=AFALARAMATAZBDBEBJBOBWBRBGBFKHCMCACLCNCOCGCDCRHRCYCZDJECEGFIFRGEDEGHGRGTHNHKHUINIDIRIQIEILITJ' \
+          'PKZKEKRKGLVLBLTLUMKMWMYMVMXMDMNMEMZNPNLNZNINGNOPKPSPAPYPEPHPLPTPRRORUSARSSLSGSKSISOZAESCHTWTHTRUGUAAEGBUSUYUZVEVN&maxtime=1000&type=hs&start='
+
+    uses_browser = True
+
+    def __init__(self, pages=3, max_wait=30):
+        self.urls = [f'{self.url}{start}' for start in range(0, 64 * pages, 64)]  # 64 proxies per page
+        self.max_wait = max_wait
+
+    def fetch(self, url):
+        options = Options()
+        options.headless = True
+        driver = webdriver.Firefox(options=options, service_log_path='/dev/null')
+        try:
+            driver.get(url)
+            # Waits until the rows are there, iso a fixed sleep
+            WebDriverWait(driver, self.max_wait).until(expected_conditions.presence_of_element_located((By.CSS_SELECTOR, '.table_block tbody tr')))
+            return driver.page_source
+        finally:
+            driver.quit()
+
+    def parse(self, html):
+        soup = BeautifulSoup(html, 'lxml')
+        table = soup.find(class_='table_block')
+        if table is None or table.tbody is None: return []
+        list_td = [tr.find_all('td') for tr in table.tbody.find_all('tr')]
+        return [(td[0].text, td[1].text) for td in list_td if len(td) > 1]
+
+
+proxy_sources = {}  # name: ProxySource
+
+
+def register_proxy_source(source):
+    proxy_sources[source.name] = source
+
+
+register_proxy_source(FreeProxyList())
+register_proxy_source(HideMyName())
+
+
+class ProxyHarvester:
+    """
+    Fetches all pages of the registered proxy sources concurrently, with at most 'concurrency' requests at the same time.
+    Pages rendered by a browser have their own limit, 'max_browsers', because every one runs its own Firefox.
+    A page that fails is logged and skipped, it doesn't stop the other pages.
+    """
+    headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:80.0) Gecko/20100101 Firefox/80.0'}
+
+    def __init__(self, source_names=None, concurrency=20, timeout=30, max_browsers=2):
+        self.sources = [source for name, source in proxy_sources.items() if not source_names or name in source_names]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_browsers = max_browsers
+
+    def harvest(self):
+        # Returns a list of unique proxies {'datetime': datetime, 'ip': ip, 'port': port, 'source': name}
+        return asyncio.run(self.harvest_async())
+
+    async def harvest_async(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        browser_semaphore = asyncio.Semaphore(self.max_browsers)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(headers=self.headers, timeout=timeout) as session:
+            pages = await asyncio.gather(*[self._fetch_a_page(session, browser_semaphore if source.uses_browser else semaphore, source, url)
+                                           for source in self.sources for url in source.urls])
+        proxies = {}
+        now = datetime.now()
+        for source, ip_ports in pages:
+            for ip, port in ip_ports:
+                key = (ip.strip(), port.strip())
+                if key not in proxies:  # The first source wins
+                    proxies[key] = {'datetime': now, 'ip': key[0], 'port': key[1], 'source': source.name}
+        logger.info(f'Harvested {len(proxies)} unique proxies from {len(pages)} pages of {len(self.sources)} sources')
+        return list(proxies.values())
+
+    @staticmethod
+    async def _fetch_a_page(session, semaphore, source, url):
+        async with semaphore:
+            try:
+                if source.uses_browser:  # Blocking, in an executor so the other pages go on
+                    html = await asyncio.get_event_loop().run_in_executor(None, source.fetch, url)
+                else:
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        html = await response.text()
+                ip_ports = source.parse(html)
+            except:
+                logger.error(f'Harvesting proxies failed | {source.name}, {url}: {sys.exc_info()[1]}')
+                return source, []
+        logger.info(f'Harvested {len(ip_ports)} proxies | {source.name}, {url}')
+        return source, ip_ports
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,91 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - proxy_health_monitor.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import functools
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config import PROXY_MONITOR_INTERVAL, PROXY_MONITOR_BASE_INTERVAL, PROXY_MONITOR_BATCH_SIZE
+from scraper.business.proxy_prober import ProxyProber
+from scraper.database.proxy_facade import get_proxies, save_proxy_tests, update_proxies_ratio
+from tools.logger import logger
+
+"""
+Keeps the delay, blacklisted and fail_ratio of the proxies up to date, so that a scraping session starts with proxies that are already ranked
+and doesn't have to find the dead ones by spending its max_fails.
+
+python -m scraper.business.proxy_health_monitor     runs the monitor until it's stopped
+"""
+
+
+class ProxyHealthMonitor:
+    """
+    Every 'interval' seconds the proxies that are due are tested again with the ProxyProber, at most 'batch_size' per round, the most overdue first.
+    Then fail_ratio is recalculated from the scraping stats.
+
+    A proxy is due when (seconds since its last test) * weight >= 'base_interval'. Proxies that were never tested are always due.
+    weight = (1 + fail_weight * scrape_n_failed / scrape_n_used)    failing proxies are tested sooner
+             * use_weight, when used in the last 'base_interval'   so are the proxies that sessions are using
+             * blacklisted_weight, when blacklisted                 dead proxies are tested less often, but they can come back
+    """
+
+    def __init__(self, interval=PROXY_MONITOR_INTERVAL, base_interval=PROXY_MONITOR_BASE_INTERVAL, batch_size=PROXY_MONITOR_BATCH_SIZE,
+                 fail_weight=4, use_weight=2, blacklisted_weight=.25):
+        self.interval = interval
+        self.base_interval = base_interval
+        self.batch_size = batch_size
+        self.fail_weight = fail_weight
+        self.use_weight = use_weight
+        self.blacklisted_weight = blacklisted_weight
+
+    def run(self):
+        logger.info('=' * 100)
+        logger.info(f'Start proxy health monitor | interval={self.interval}, base_interval={self.base_interval}, batch_size={self.batch_size}')
+        logger.info('=' * 100)
+        asyncio.run(self._run())
+
+    async def _run(self):
+        while True:
+            started_at = time.monotonic()
+            try:
+                await self.check_proxies()
+            except:
+                logger.error(f'Proxy health check failed: {sys.exc_info()}')
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started_at), 0))
+
+    async def check_proxies(self):
+        loop = asyncio.get_event_loop()
+        proxies_df = await loop.run_in_executor(None, functools.partial(get_proxies, blacklisted=None))
+        due_proxies = self.get_due_proxies(proxies_df, datetime.now())
+        logger.info(f'Proxy health check | due={len(due_proxies)}, proxies={len(proxies_df)}')
+        if due_proxies:
+            proxy_tests = await ProxyProber().probe_async(due_proxies)  # A new prober per round, so its histograms are those of the round
+            await loop.run_in_executor(None, save_proxy_tests, proxy_tests)
+        await loop.run_in_executor(None, update_proxies_ratio)
+
+    def get_due_proxies(self, proxies_df, now):
+        # Returns [{'ip': ip, 'port': port}, ...], the most overdue first
+        if proxies_df.empty: return []
+        df = proxies_df.reindex(columns=['ip', 'port', 'blacklisted', 'test_timestamp', 'timestamp', 'scrape_n_used', 'scrape_n_failed'])
+        # Reset stats have timestamp datetime.min, which pandas can't hold. It becomes NaT: not used recently.
+        tested_ago = (now - pd.to_datetime(df['test_timestamp'], errors='coerce')).dt.total_seconds().fillna(np.inf)
+        used_ago = (now - pd.to_datetime(df['timestamp'], errors='coerce')).dt.total_seconds().fillna(np.inf)
+        n_used = df['scrape_n_used'].fillna(0)
+        n_failed = df['scrape_n_failed'].fillna(0)
+        weight = (1 + self.fail_weight * n_failed / n_used.where(n_used > 0, 1)) \
+                 * np.where(used_ago < self.base_interval, self.use_weight, 1) \
+                 * np.where(df['blacklisted'].fillna(True).astype(bool), self.blacklisted_weight, 1)
+        df['overdue'] = tested_ago * weight
+        df = df[df['overdue'] >= self.base_interval].sort_values('overdue', ascending=False).head(self.batch_size)
+        return df[['ip', 'port']].to_dict('records')
+
+
+if __name__ == '__main__':
+    ProxyHealthMonitor().run()
@@ -0,0 +1,312 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - proxy_pool.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import contextlib
+import itertools
+import random
+import statistics
+import time
+
+from tools.logger import logger
+
+"""
+The pool of proxy servers used by a scraping session.
+"""
+
+
+class TokenBucket:
+    """
+    Allows 'rate' requests per second on average, with bursts of at most 'burst' requests.
+    """
+
+    def __init__(self, rate=1.0, burst=2):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    def has_token(self):
+        self._refill()
+        return self._tokens >= 1
+
+    def take(self):
+        self._refill()
+        self._tokens -= 1
+
+    def wait_time(self):
+        # Nr of seconds until there's a token
+        self._refill()
+        return max((1 - self._tokens) / self.rate, 0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class CircuitBreaker:
+    """
+    closed:     Requests go through. After 'fail_threshold' consecutive failures the breaker opens.
+    open:       No requests for 'cool_down' seconds. Then the breaker is half-open.
+    half-open:  At most 'n_probes' requests at the same time probe the proxy. A success closes the breaker, a failure opens it again.
+    """
+
+    def __init__(self, name, fail_threshold=3, cool_down=300, n_probes=1):
+        self.name = name
+        self.fail_threshold = fail_threshold
+        self.cool_down = cool_down
+        self.n_probes = n_probes
+        self.state = 'closed'
+        self._n_fails = 0
+        self._n_probing = 0
+        self._opened_at = None
+
+    def allows(self):
+        if self.state == 'open' and time.monotonic() - self._opened_at >= self.cool_down:
+            self.state, self._n_probing = 'half-open', 0
+            logger.info(f'Circuit breaker half-open | {self.name}')
+        if self.state == 'closed':
+            return True
+        if self.state == 'half-open':
+            return self._n_probing < self.n_probes
+        return False
+
+    def on_request(self):
+        if self.state == 'half-open':
+            self._n_probing += 1
+
+    def cancel_request(self):
+        # The request won't be recorded (yet), it no longer takes a probe
+        if self.state == 'half-open':
+            self._n_probing = max(self._n_probing - 1, 0)
+
+    def record(self, ok):
+        if self.state == 'half-open':
+            self._n_probing = max(self._n_probing - 1, 0)
+        if ok:
+            if self.state != 'closed':
+                logger.info(f'Circuit breaker closed | {self.name}')
+            self.state, self._n_fails = 'closed', 0
+            return
+        self._n_fails += 1
+        if self.state == 'half-open' or self._n_fails >= self.fail_threshold:
+            if self.state != 'open':
+                logger.warning(f'Circuit breaker open | {self.name}, fails={self._n_fails}')
+            self.state, self._opened_at = 'open', time.monotonic()
+
+
+class ProxyArm:
+    """
+    What the pool knows about a proxy, for the Thompson sampling.
+    success:    Beta(alpha, beta). The prior comes from the totals in the database, counted as at most 'prior_n' requests,
+                so old history doesn't outweigh what's seen in the session. A new proxy starts at Beta(1, 1): very uncertain, so it gets tried.
+    speed:      'delay' is the latency measured by the proxy tests. 'durations' are the moving averages of its scrape durations in the session,
+                per task, in seconds per unit of work (e.g. a page of tweets), so scrapes of different sizes and tasks can be compared.
+    """
+
+    def __init__(self, n_used=0, n_failed=0, delay=None, prior_n=20):
+        n_failed = min(max(n_failed, 0), max(n_used, 0))
+        scale = min(1, prior_n / n_used) if n_used > 0 else 1
+        self.alpha = 1 + (n_used - n_failed) * scale
+        self.beta = 1 + n_failed * scale
+        self.delay = delay if delay and 0 < delay < 999999 else None  # 999999: not tested, 0: failed the test
+        self.durations = {}  # task: seconds per unit
+
+    def sample(self):
+        return random.betavariate(self.alpha, self.beta)
+
+    def record(self, ok, duration=None, task=None, smoothing=.2):
+        if ok:
+            self.alpha += 1
+        else:
+            self.beta += 1
+        if ok and duration is not None:
+            self.durations[task] = duration if task not in self.durations else (1 - smoothing) * self.durations[task] + smoothing * duration
+
+
+class ProxyLease:
+    def __init__(self, lease_id, proxy, expires):
+        self.lease_id = lease_id
+        self.proxy = proxy  # {'ip': ip, 'port': port}
+        self.expires = expires
+        self.released = False
+
+
+class ProxyPool:
+    """
+    Hands out the proxy servers as leases that expire after 'lease_time' seconds, unless they're renewed.
+    A scrape runs in 'async with pool.renewing(lease)', which renews its lease while it runs. So only leases that are never given back expire.
+    Expiring frees the proxy without counting a failure. When the lease is released after it expired, its result still counts.
+    A proxy has at most 'max_holders' holders at the same time, 1 unless oversubscription is wanted.
+    Every proxy has a TokenBucket that limits its request rate and a CircuitBreaker that keeps failing proxies out of use for a while.
+    The scrapes take a token before every request they send, with wait_for_token(lease). A lease is for a whole scrape, many requests.
+    The pool lives on the event loop of the scraping session, so getting its occupancy doesn't cost any IPC.
+
+    'get_proxies_function' is a blocking function that returns a list of proxies {'ip': ip, 'port': port}, the preferred ones first.
+    The proxies can also have 'delay', 'scrape_n_used_total' and 'scrape_n_failed_total', for the Thompson sampling.
+    It's called when the pool runs (almost) empty, by one caller at a time and no more than once every 'min_populate_interval' seconds.
+
+    'selection' chooses among the proxies that are free:
+    - 'ordered':    the first one in order of preference
+    - 'thompson':   Thompson sampling. Every proxy draws a success probability from its ProxyArm and the proxy with the highest
+                    success probability / relative latency wins. The relative latency is its scrape duration per unit compared to the pool's average
+                    of the same task (averaged over the tasks it did), or its tested delay compared to the median delay while it hasn't got a duration yet.
+                    Most requests go to the fast, reliable proxies. New and uncertain proxies still win some draws, so they're evaluated.
+                    'prior_n' controls the exploration: the lower, the less the history in the database counts and the more is explored.
+    """
+
+    def __init__(self, get_proxies_function, lease_time=900, max_holders=1, min_populate_interval=10,
+                 rate=1.0, burst=2, fail_threshold=3, cool_down=300, n_probes=1, selection='thompson', prior_n=20):
+        self.get_proxies_function = get_proxies_function
+        self.lease_time = lease_time
+        self.max_holders = max_holders
+        self.min_populate_interval = min_populate_interval
+        self.rate, self.burst = rate, burst
+        self.fail_threshold, self.cool_down, self.n_probes = fail_threshold, cool_down, n_probes
+        self.selection = selection
+        self.prior_n = prior_n
+
+        self._proxies = {}  # (ip, port): proxy. In order of preference.
+        self._holders = {}  # (ip, port): nr of holders
+        self._buckets = {}  # (ip, port): TokenBucket
+        self._breakers = {}  # (ip, port): CircuitBreaker
+        self._arms = {}  # (ip, port): ProxyArm
+        self._median_delay = None
+        self._mean_durations = {}  # task: moving average of the scrape durations per unit of all proxies
+        self._leases = {}  # lease_id: lease
+        self._lease_ids = itertools.count()
+        self._populated_at = -min_populate_interval
+        self._populating = asyncio.Lock()
+        self._released = asyncio.Event()
+
+    def __str__(self):
+        o = self.occupancy()
+        return f'{o["free"]}/{o["leased"]}/{o["open"]}/{o["proxies"]}'  # free/leased/open/proxies
+
+    def occupancy(self):
+        n_leased = sum(1 for key in self._proxies if self._holders.get(key, 0))
+        n_free = sum(1 for key in self._proxies if self._holders.get(key, 0) < self.max_holders)
+        n_open = sum(1 for key in self._proxies if self._breakers[key].state == 'open')
+        return {'proxies': len(self._proxies), 'leased': n_leased, 'free': n_free, 'open': n_open, 'leases': len(self._leases)}
+
+    async def populate(self):
+        async with self._populating:
+            loop = asyncio.get_event_loop()
+            proxies = await loop.run_in_executor(None, self.get_proxies_function)
+            self._populated_at = time.monotonic()
+            for proxy in proxies:
+                key = (proxy['ip'], proxy['port'])
+                if key not in self._proxies:  # No duplicates
+                    self._proxies[key] = {'ip': proxy['ip'], 'port': proxy['port']}
+                    self._buckets[key] = TokenBucket(self.rate, self.burst)
+                    self._breakers[key] = CircuitBreaker(f'{proxy["ip"]}:{proxy["port"]}', self.fail_threshold, self.cool_down, self.n_probes)
+                    self._arms[key] = ProxyArm(proxy.get('scrape_n_used_total', 0), proxy.get('scrape_n_failed_total', 0), proxy.get('delay'), self.prior_n)
+            delays = [arm.delay for arm in self._arms.values() if arm.delay is not None]
+            self._median_delay = statistics.median(delays) if delays else None
+            logger.warning(f'Proxy pool populated. Contains {len(self._proxies)} servers')
+        self._released.set()
+
+    async def acquire(self):
+        while True:
+            self._expire_leases()
+            key = self._free_proxy()
+            if key is not None:
+                return self._lease(key)
+            n_usable = sum(1 for breaker in self._breakers.values() if breaker.state != 'open')
+            if n_usable <= 1 and not self._populating.locked() and time.monotonic() - self._populated_at >= self.min_populate_interval:
+                await self.populate()
+                continue
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, lease, ok=True, duration=None, task=None, n_units=1):
+        """
+        Gives the proxy of the lease back to the pool and tells its circuit breaker and its ProxyArm whether the request succeeded.
+        'duration' is the nr of seconds the successful request took, for 'n_units' units of work of 'task', e.g. 3 pages of tweets.
+        Only durations of the same task are compared.
+        An expired lease was already taken back, only its result is recorded.
+        """
+        if lease.released:
+            return
+        lease.released = True
+        key = (lease.proxy['ip'], lease.proxy['port'])
+        if self._leases.pop(lease.lease_id, None) is not None:
+            self._holders[key] -= 1
+        self._breakers[key].record(ok)
+        if duration is not None:
+            duration /= max(n_units, 1)
+        self._arms[key].record(ok, duration, task)
+        if ok and duration is not None:
+            mean = self._mean_durations.get(task)
+            self._mean_durations[task] = duration if mean is None else .95 * mean + .05 * duration
+        self._released.set()
+
+    async def wait_for_token(self, lease):
+        # Waits until the proxy of the lease may send the next request. The holders of a proxy share its bucket.
+        bucket = self._buckets[(lease.proxy['ip'], lease.proxy['port'])]
+        while not bucket.has_token():
+            await asyncio.sleep(bucket.wait_time())
+        bucket.take()
+
+    def renew(self, lease):
+        if lease.lease_id in self._leases:
+            lease.expires = time.monotonic() + self.lease_time
+
+    @contextlib.asynccontextmanager
+    async def renewing(self, lease):
+        # Renews the lease every half 'lease_time' while the block runs
+        async def _renew():
+            while True:
+                await asyncio.sleep(self.lease_time / 2)
+                self.renew(lease)
+
+        renew_task = asyncio.ensure_future(_renew())
+        try:
+            yield lease
+        finally:
+            renew_task.cancel()
+
+    def _free_proxy(self):
+        free_keys = (key for key in self._proxies
+                     if self._holders.get(key, 0) < self.max_holders and self._breakers[key].allows())
+        if self.selection == 'ordered':
+            return next(free_keys, None)
+        return max(free_keys, key=self._thompson_score, default=None)
+
+    def _thompson_score(self, key):
+        arm = self._arms[key]
+        relative_latencies = [duration / self._mean_durations[task] for task, duration in arm.durations.items() if self._mean_durations.get(task)]
+        if relative_latencies:
+            relative_latency = statistics.mean(relative_latencies)
+        elif arm.delay is not None and self._median_delay:
+            relative_latency = arm.delay / self._median_delay
+        else:
+            relative_latency = 1
+        return arm.sample() / min(max(relative_latency, .1), 10)
+
+    def _lease(self, key):
+        self._holders[key] = self._holders.get(key, 0) + 1
+        self._breakers[key].on_request()
+        lease = ProxyLease(next(self._lease_ids), self._proxies[key], time.monotonic() + self.lease_time)
+        self._leases[lease.lease_id] = lease
+        return lease
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for lease in [lease for lease in self._leases.values() if lease.expires <= now]:
+            logger.warning(f'Proxy lease expired | {lease.proxy["ip"]}:{lease.proxy["port"]}')
+            key = (lease.proxy['ip'], lease.proxy['port'])
+            del self._leases[lease.lease_id]
+            self._holders[key] -= 1
+            self._breakers[key].cancel_request()
+            self._released.set()
+
+
+if __name__ == '__main__':
+    pass
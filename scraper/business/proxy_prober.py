@@ -0,0 +1,141 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - proxy_prober.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import sys
+import time
+from datetime import datetime
+
+from config import PROXY_PROBE_TARGET, PROXY_PROBE_METHOD, PROXY_PROBE_TIMEOUT, PROXY_PROBE_CONCURRENCY
+from scraper.database.proxy_facade import get_proxies, save_proxy_tests
+from tools.logger import logger
+
+"""
+Tests proxy servers with one cheap request through each proxy, thousands at the same time on one event loop.
+- CONNECT:  asks the proxy for a tunnel to the target. A proxy that answers 200 works.
+- GET:      asks the proxy for http://target/. A proxy that answers 2xx or 3xx works.
+Nothing is sent through the tunnel, so no TLS handshake and no Twitter request is needed.
+
+Error codes:
+- 0: ok
+- 1: the proxy answered, but not with a success status
+- 2: timeout
+- 3: connection error
+- 9: unknown error
+
+The target is configurable, so the prober can be tried against a local stand-in proxy and http server:
+    ProxyProber(target='127.0.0.1:8000', method='GET').probe([{'ip': '127.0.0.1', 'port': '3128'}])
+"""
+
+
+class LatencyHistogram:
+    bounds = (.05, .1, .25, .5, 1, 2.5, 5, 10)  # Seconds. The last bucket counts everything above 10 s.
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.n = 0
+        self.total = 0
+
+    def __str__(self):
+        buckets = [f'<={bound}s: {count}' for bound, count in zip(self.bounds, self.counts)] + [f'>{self.bounds[-1]}s: {self.counts[-1]}']
+        avg = self.total / self.n if self.n else 0
+        return f'{self.name} | n={self.n}, avg={avg:.3f}s | {", ".join(buckets)}'
+
+    def add(self, seconds):
+        i = next((i for i, bound in enumerate(self.bounds) if seconds <= bound), len(self.bounds))
+        self.counts[i] += 1
+        self.n += 1
+        self.total += seconds
+
+
+class ProxyProber:
+    def __init__(self, target=PROXY_PROBE_TARGET, method=PROXY_PROBE_METHOD, timeout=PROXY_PROBE_TIMEOUT, concurrency=PROXY_PROBE_CONCURRENCY):
+        self.host, self.port = target.rsplit(':', 1)
+        self.method = method
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.connect_histogram = LatencyHistogram('connect')
+        self.first_byte_histogram = LatencyHistogram('first byte')
+
+    def test_proxies(self, blacklisted=None):
+        # Tests the proxies in the database and saves the results. blacklisted=None: all proxies.
+        logger.info('=' * 100)
+        logger.info(f"Start testing {'all' if blacklisted is None else 'blacklisted' if blacklisted else 'not blacklisted'} proxy servers")
+        logger.info('=' * 100)
+        proxies_df = get_proxies(blacklisted=blacklisted)
+        if proxies_df.empty: return {'n_tested': 0, 'n_ok': 0}
+        proxy_tests = self.probe(proxies_df[['ip', 'port']].to_dict('records'))
+        save_proxy_tests(proxy_tests)
+        return {'n_tested': len(proxy_tests), 'n_ok': sum(1 for proxy_test in proxy_tests if not proxy_test['blacklisted'])}
+
+    def probe(self, proxies):
+        # proxies = [{'ip': ip, 'port': port}, ...]. Returns the proxy tests, without saving them.
+        return asyncio.run(self.probe_async(proxies))
+
+    async def probe_async(self, proxies):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _limited(proxy):
+            async with semaphore:
+                return await self.probe_a_proxy(proxy)
+
+        proxy_tests = await asyncio.gather(*[_limited(proxy) for proxy in proxies])
+        logger.info(f'Tested {len(proxy_tests)} proxies | ok={sum(1 for proxy_test in proxy_tests if not proxy_test["blacklisted"])}, target={self.host}:{self.port}')
+        logger.info(self.connect_histogram)
+        logger.info(self.first_byte_histogram)
+        return proxy_tests
+
+    async def probe_a_proxy(self, proxy):
+        connect_delay, first_byte_delay = 0, 0
+        blacklisted, error_code = True, 9
+        writer = None
+        start = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(proxy['ip'], int(proxy['port'])), self.timeout)
+            connect_delay = time.monotonic() - start
+            self.connect_histogram.add(connect_delay)
+            writer.write(self._request())
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            first_byte_delay = time.monotonic() - start
+            if self._is_success(status_line):
+                self.first_byte_histogram.add(first_byte_delay)
+                blacklisted, error_code = False, 0
+            else:
+                error_code = 1
+                logger.debug(f'Bad answer | {proxy["ip"]}:{proxy["port"]}: {status_line[:100]}')
+        except asyncio.TimeoutError:
+            error_code = 2
+        except (OSError, ValueError) as e:  # ValueError: not a valid port
+            error_code = 3
+            logger.debug(f'Connection error | {proxy["ip"]}:{proxy["port"]}: {e}')
+        except:
+            logger.error(f'Testing proxy failed | {proxy["ip"]}:{proxy["port"]}: {sys.exc_info()}')
+        finally:
+            if writer: writer.close()
+        return {'ip': proxy['ip'], 'port': proxy['port'],
+                'delay': first_byte_delay if not blacklisted else 0,
+                'connect_delay': connect_delay,
+                'blacklisted': blacklisted, 'error_code': error_code,
+                'timestamp': datetime.now()}
+
+    def _request(self):
+        if self.method == 'CONNECT':
+            request = f'CONNECT {self.host}:{self.port} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n'
+        else:
+            request = f'GET http://{self.host}:{self.port}/ HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\n\r\n'
+        return request.encode()
+
+    def _is_success(self, status_line):
+        # status_line = b'HTTP/1.1 200 Connection established\r\n'
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/') or not parts[1].isdigit(): return False
+        status = int(parts[1])
+        return status == 200 if self.method == 'CONNECT' else 200 <= status < 400
+
+
+if __name__ == '__main__':
+    pass
@@ -5,23 +5,21 @@
 # --------------------------------------------------------------------------------------------------------
 # TODO: NEEDS REFACTORING
 
-from scraper.business.proxy_scraper import ProxyScraper
+import pandas as pd
+
+from scraper.business.proxy_harvester import ProxyHarvester
+from scraper.business.proxy_prober import ProxyProber
 from scraper.database.proxy_facade import reset_proxies_stats, save_proxies
 from tools.logger import logger
 
 
 def scrape_proxies():
-    ps = ProxyScraper()
     logger.info('=' * 100)
     logger.info('Start scrapping Proxies')
     logger.info('=' * 100)
-    logger.info(f'Start scraping proxies from free_proxy_list.net')
-    proxies_df = ps.scrape_free_proxy_list()
-    save_proxies(proxies_df)
-    logger.info(f'Start scraping proxies from hidemy.name')
-    proxies_df = ps.scrape_hide_my_name()
-    save_proxies(proxies_df)
-    ps.test_proxies()
+    proxies = ProxyHarvester().harvest()
+    save_proxies(pd.DataFrame(proxies))
+    ProxyProber().test_proxies()
 
 
 def reset_proxy_servers():
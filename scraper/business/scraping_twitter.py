@@ -3,23 +3,32 @@
 # src - scraping_twitter.py
 # md
 # --------------------------------------------------------------------------------------------------------
-import multiprocessing as mp
+import asyncio
+import functools
+import math
 import sys
+import threading
 import time
 from concurrent.futures import TimeoutError
 from concurrent.futures._base import CancelledError
 from datetime import datetime, timedelta
-from queue import Empty
 from random import random
 
 import pandas as pd
 from aiohttp import ServerDisconnectedError, ClientOSError, ClientHttpProxyError, ClientProxyConnectionError
 
+from scraper.business.proxy_pool import ProxyPool
+from scraper.business.tweet_writer import TweetWriter
 from scraper.business.twitter_scraper import TweetScraper, ProfileScraper
-from scraper.database.log_facade import log_scraping_profile, log_scraping_tweets, get_max_sesion_id, get_dead_tweets_periods
+from scraper.database.indexes import setup_indexes
+from scraper.database.log_facade import log_scraping_profile, log_scraping_tweets, get_new_session_id, get_dead_tweets_periods, get_last_ended_session_id
+from scraper.database.log_facade import start_session, end_session, get_session_config, save_session_plan, session_user_planned, get_unplanned_session_users
+from scraper.database.log_facade import journal_tweets_tasks, journal_tweets_task_done, journal_tweets_tasks_done, get_unfinished_tweets_tasks, flush_logs
 from scraper.database.proxy_facade import get_proxies, update_proxy_stats, update_proxies_ratio
-from scraper.database.twitter_facade import get_join_date, get_nr_tweets_per_day, save_tweets, save_a_profile, get_a_profile
-from scraper.database.twitter_facade import get_usernames
+from scraper.database.twitter_facade import get_join_date, get_nr_tweets_per_day, save_a_profile, get_avg_tweets_per_day
+from scraper.database.twitter_facade import get_high_water_mark, backfill_high_water_marks, mark_periods_scraped, get_periods_not_scraped, get_tweets_per_day_rates
+from scraper.database.twitter_facade import get_scraped_through_date
+from scraper.database.twitter_facade import get_usernames, get_existing_usernames
 from tools.logger import logger
 
 """
@@ -28,38 +37,90 @@ A collection of functions to control scraping and saving proxy servers, Twitter
 
 ####################################################################################################################################################################################
 cfg = {
-    'n_processes': 25,
+    'concurrency': 200,  # Max number of profiles or periods scraped at the same time on the event loop
     'session_begin_date': datetime(2006, 1, 1).date(),
     'session_end_date': datetime.now().date(),
     'time_delta': 100,
+    'period_sizing': 'fixed',  # 'fixed': periods of 'time_delta' days, 'adaptive': periods of about 'target_tweets' tweets
+    'target_tweets': 500,  # Adaptive period sizing: nr of tweets to aim for per period
+    'max_time_delta': 365,  # Adaptive period sizing: max nr of days of a period
     'max_fails': 8,
+    'proxy_lease_time': 900,  # Seconds after which a proxy that isn't given back returns to the pool. Running scrapes renew their lease.
+    'proxy_max_holders': 1,  # Nr of scrapes that can use the same proxy at the same time
+    'proxy_rate': 1.0,  # Max nr of requests per second per proxy. Every page of 20 tweets is a request.
+    'proxy_burst': 2,  # Max nr of requests per proxy in a burst
+    'breaker_fail_threshold': 3,  # Nr of consecutive failures after which a proxy isn't used for 'breaker_cool_down' seconds
+    'breaker_cool_down': 300,
+    'breaker_probes': 1,  # Nr of requests that probe a proxy after its cool-down
+    'proxy_selection': 'thompson',  # 'thompson': trade off success and speed of the proxies (see ProxyPool), 'ordered': lowest fail_ratio first
+    'proxy_prior_n': 20,  # Thompson sampling: max nr of requests the history in the database counts for. Lower explores more.
     'scrape_only_missing_dates': False,
     'min_tweets': 1,
+    'incremental': False,  # Scrape from the newest stored tweet of each user, or from after the days scraped since then (minus 'incremental_overlap' days), never before session_begin_date
+    'incremental_overlap': 3,  # Nr of days before the newest stored tweet that are scraped again, to refresh likes, replies and retweets
+    'schedule': 'alphabetical',  # 'alphabetical' or 'activity': periods with the most expected tweets first
+    'activity_days': 30,  # Activity schedule: nr of recent days used to calculate the tweets per day rate of the users
+    'time_budget': None,  # Nr of seconds after which no new periods are started. The remaining periods can be resumed.
+    'writer_batch_size': 5000,  # The tweet writer saves when this nr of tweets is waiting...
+    'writer_flush_interval': 5,  # ... or after this nr of seconds
+    'writer_queue_size': 100,  # Max nr of scraped periods waiting to be saved before the scrapers have to wait
 }
 
 
 class TwitterScrapingSession:
     def __init__(self, config=None):
         if config: cfg.update(config)
-        self.c = cfg
-        self.n_processes = self.c['n_processes']
-        self.session_begin_date = self.c['session_begin_date']
-        self.session_end_date = self.c['session_end_date']
-        self.timedelta = self.c['time_delta']
-        self.max_fails = self.c['max_fails']
-        self.missing_dates = self.c['scrape_only_missing_dates']
-        self.min_tweets = self.c['min_tweets']
+        self._apply_config(cfg)
 
         self.usersnames_df = pd.DataFrame()
         self.scrape_profiles = False
         self.scrape_tweets = False
         self.rescrape = False
-
-        manager = mp.Manager()
-        self.proxy_queue = manager.Queue()
-        self.session_id = get_max_sesion_id() + 1
+        self.resume_tasks_df = None
+        self.resume_plan = []  # (username, session_begin_date, session_end_date)'s of a resumed session that weren't planned yet
+
+        self.proxy_pool = None  # ProxyPool, created in start() because it belongs to the event loop
+        self.tweet_writer = None  # TweetWriter thread, only while scraping tweets
+        self.n_periods_left = {}  # username: nr of its periods that aren't saved or dead yet
+        self._n_periods_left_lock = threading.Lock()  # Also updated by the on_saved thread of the tweet writer
+        self.started_at = None
+        self.totals = {'profiles_ok': 0, 'profiles_dead': 0, 'periods_ok': 0, 'periods_dead': 0, 'tweets': 0}
+        setup_indexes()
+        self.session_id = get_new_session_id()
         # if system_cfg.reset_proxies_stat: reset_proxies_stats()
 
+    def _apply_config(self, config):
+        self.c = config
+        self.concurrency = self.c['concurrency']
+        self.session_begin_date = self.c['session_begin_date']
+        self.session_end_date = self.c['session_end_date']
+        self.timedelta = self.c['time_delta']
+        self.period_sizing = self.c['period_sizing']
+        self.target_tweets = self.c['target_tweets']
+        self.max_time_delta = self.c['max_time_delta']
+        self.max_fails = self.c['max_fails']
+        self.proxy_lease_time = self.c['proxy_lease_time']
+        self.proxy_max_holders = self.c['proxy_max_holders']
+        self.proxy_rate = self.c['proxy_rate']
+        self.proxy_burst = self.c['proxy_burst']
+        self.breaker_fail_threshold = self.c['breaker_fail_threshold']
+        self.breaker_cool_down = self.c['breaker_cool_down']
+        self.breaker_probes = self.c['breaker_probes']
+        self.proxy_selection = self.c['proxy_selection']
+        self.proxy_prior_n = self.c['proxy_prior_n']
+        self.missing_dates = self.c['scrape_only_missing_dates']
+        self.min_tweets = self.c['min_tweets']
+        self.incremental = self.c['incremental']
+        self.incremental_overlap = self.c['incremental_overlap']
+        self.schedule = self.c['schedule']
+        self.activity_days = self.c['activity_days']
+        self.time_budget = self.c['time_budget']
+        self.writer_batch_size = self.c['writer_batch_size']
+        self.writer_flush_interval = self.c['writer_flush_interval']
+        self.writer_queue_size = self.c['writer_queue_size']
+        self.tweet_scraper = TweetScraper(self.c)  # The scrapers keep no state of a scrape, one of each serves all concurrent scrapes
+        self.profile_scraper = ProfileScraper(self.c)
+
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # INTERFACE
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -76,11 +137,10 @@ class TwitterScrapingSession:
     def users_list(self, usernames, only_new=True):
         usernames = [u.lower() for u in usernames]
         if only_new:
-            for username in usernames.copy():
-                if get_a_profile(username):
-                    logger.debug(f'Username {username} already exists')
-                    usernames.remove(username)
-                    logger.info(f'Username already exists | {username}')
+            existing_usernames = get_existing_usernames(usernames)
+            for username in existing_usernames:
+                logger.info(f'Username already exists | {username}')
+            usernames = [u for u in usernames if u not in existing_usernames]
         self.usersnames_df = pd.DataFrame(usernames, columns=['username'])
         return self
 
@@ -96,6 +156,7 @@ class TwitterScrapingSession:
 
     def rescrape_dead_periods(self, session_id=-1):
         self.rescrape = True
+        if session_id == -1: session_id = get_last_ended_session_id()  # The session that ended last
         self.usersnames_df = get_dead_tweets_periods(session_id=session_id)
         logger.warning(f'Rescraping following periods')
         print(self.usersnames_df)
@@ -103,6 +164,28 @@ class TwitterScrapingSession:
         self.scrape_tweets = True
         return self
 
+    def resume(self, session_id):
+        """
+        Continues a tweets session that was interrupted, with the same session_id and the config it was started with.
+        Only the periods in the session's journal that weren't scraped yet are scraped again. They aren't re-planned.
+        Users whose periods weren't planned yet when the session stopped are planned.
+        """
+        self.session_id = session_id
+        session_config = get_session_config(session_id)
+        if session_config:
+            self._apply_config(dict(self.c, **session_config))  # Keys added since the session started keep their current value
+        else:  # Sessions from before the sessions collection
+            logger.warning(f'No config stored for session {session_id}, resuming with the current config')
+        self.rescrape = session_id < 0  # Rescraping sessions have negative session_id's
+        self.resume_tasks_df = get_unfinished_tweets_tasks(session_id)
+        journal_usernames = set(self.resume_tasks_df['username']) if not self.resume_tasks_df.empty else set()
+        self.resume_plan = [task for task in get_unplanned_session_users(session_id) if task[0] not in journal_usernames]
+        logger.warning(f'Resuming session {session_id} | {len(self.resume_tasks_df)} periods left, {len(self.resume_plan)} users to plan')
+        usernames = sorted(journal_usernames | {username for username, _, _ in self.resume_plan})
+        self.usersnames_df = pd.DataFrame(usernames, columns=['username']) if usernames else pd.DataFrame()
+        self.scrape_tweets = True
+        return self
+
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # ENGINE
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -116,160 +199,264 @@ class TwitterScrapingSession:
             logger.warning(f'Nothing to do. Did you forget to set "users_all" or "users_list"? Or all users already exist?')
             return None
         else:
-            n_processes = min(len(self.usersnames_df), self.n_processes)
             logger.info(
-                f'Start Twitter Scraping. | n_processes={n_processes}, session_id={self.session_id}, '
+                f'Start Twitter Scraping. | concurrency={self.concurrency}, session_id={self.session_id}, '
                 f'session_begin_date={self.session_begin_date}, session_end_date={self.session_end_date}, timedelta={self.timedelta}, missing_dates={self.missing_dates}')
+        start_session(self.session_id, self.c)
+        status = 'failed'
+        try:
+            asyncio.run(self._run())
+            status = 'interrupted' if sum(self.n_periods_left.values()) else 'ok'
+        finally:
+            flush_logs()
+            end_session(self.session_id, status, dict(self.totals, periods_left=sum(self.n_periods_left.values())))
+
+    async def _run(self):
+        self.started_at = time.monotonic()
+        self.proxy_pool = ProxyPool(self._get_proxies, lease_time=self.proxy_lease_time, max_holders=self.proxy_max_holders,
+                                    rate=self.proxy_rate, burst=self.proxy_burst,
+                                    fail_threshold=self.breaker_fail_threshold, cool_down=self.breaker_cool_down, n_probes=self.breaker_probes,
+                                    selection=self.proxy_selection, prior_n=self.proxy_prior_n)
+        semaphore = asyncio.Semaphore(self.concurrency)
         if self.scrape_profiles:
-            self._populate_proxy_queue()
-            mp_iterable = [(username,) for username in self.usersnames_df['username']]
-            with mp.Pool(processes=n_processes) as pool:
-                pool.starmap(self.scrape_a_user_profile, mp_iterable)
+            await self.proxy_pool.populate()
+            iterable = [(username,) for username in self.usersnames_df['username']]
+            await asyncio.gather(*[self._limited(semaphore, self.scrape_a_user_profile, *args) for args in iterable])
         if self.scrape_tweets:
-            self._populate_proxy_queue()
-            if self.rescrape:
-                mp_iterable = [(username, begin_date, end_date) for _, (username, begin_date, end_date) in self.usersnames_df.iterrows()]
+            await self.proxy_pool.populate()
+            self.n_periods_left = {}
+            if self.resume_tasks_df is not None:
+                tasks = self._resume_tweets_tasks() + await self._plan_tweets_tasks(self.resume_plan, semaphore)
             else:
-                mp_iterable = [(username, self.session_begin_date, self.session_end_date) for username in self.usersnames_df['username']]
-            with mp.Pool(processes=n_processes) as pool:
-                pool.starmap(self.scrape_a_user_tweets, mp_iterable)
+                if self.rescrape:
+                    iterable = [(username, begin_date, end_date) for _, (username, begin_date, end_date) in self.usersnames_df.iterrows()]
+                else:
+                    iterable = [(username, self.session_begin_date, self.session_end_date) for username in self.usersnames_df['username']]
+                await self._run_blocking(save_session_plan, self.session_id, iterable)  # So a resume can plan the users that weren't planned yet
+                tasks = await self._plan_tweets_tasks(iterable, semaphore)
+            task_queue = await self._schedule_tweets_tasks(tasks)
+            n_workers = min(task_queue.qsize(), self.concurrency)
+            logger.info(f'Start scraping {task_queue.qsize()} periods | n_workers={n_workers}')
+            self.tweet_writer = TweetWriter(self.writer_batch_size, self.writer_flush_interval, self.writer_queue_size, on_saved=self._periods_saved)
+            self.tweet_writer.start()
+            try:
+                await asyncio.gather(*[self._tweets_worker(task_queue) for _ in range(n_workers)])
+            finally:
+                await self._run_blocking(self.tweet_writer.close)
+
+    @staticmethod
+    async def _limited(semaphore, coroutine_function, *args):
+        async with semaphore:
+            await coroutine_function(*args)
+
+    @staticmethod
+    async def _run_blocking(function, *args, **kwargs):
+        # The database functions are blocking. Run them in a thread so they don't stall the other scrapes on the event loop.
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
 
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # PROFILES
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    def scrape_a_user_profile(self, username):  # Todo:  proxy stats
-        log_scraping_profile(self.session_id, 'begin', 'profile', username)
-        time.sleep(random() * 5)  # Todo: DOESN'T WORKOtherwise other objects in other processes will also start checking proxies populated, filling the queue with the same proxies
-        self._check_proxy_queue()
+    async def scrape_a_user_profile(self, username):  # Todo:  proxy stats
+        await self._run_blocking(log_scraping_profile, self.session_id, 'begin', 'profile', username)
         fail_counter = 0
         while fail_counter < self.max_fails:
-            proxy = self.proxy_queue.get()
-            profile_scraper = ProfileScraper(self.c)
-            profile_scraper.proxy_server = proxy
-            logger.info(f'Start scraping profiles | {username}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}')
+            lease = await self.proxy_pool.acquire()
+            proxy = lease.proxy
+            logger.info(f'Start scraping profiles | {username}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}')
             # Todo: When I don't add raise to the get.py / def User(...) / line 197, then fail silently.
             #       No distinction between existing user with proxy failure and canceled account.
             #       When I add raise, twint / asyncio show  error traceback in terminal
             #       ? What happens with proxies when username is canceled? Sometimes TimeoutError or TypeError
             try:  # Todo: Refactor: make method and use also in scrape_a_user_tweets
-
-                profile_df = profile_scraper.execute_scraping(username)
+                start_time = time.monotonic()
+                async with self.proxy_pool.renewing(lease):
+                    profile_df = await self.profile_scraper.execute_scraping_async(username, proxy_server=proxy,
+                                                                                   throttle=functools.partial(self.proxy_pool.wait_for_token, lease))
+                duration = time.monotonic() - start_time
 
             except:
                 print('x' * 100)
                 print(sys.exc_info()[0])
                 print(sys.exc_info())
                 print('x' * 100)
+                self.proxy_pool.release(lease, ok=False)
                 raise
             else:
                 if profile_df.empty:  # ProfileScrapingError
-                    logger.error(f'Empty profile | {username}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}')
-                    update_proxy_stats('ProfileScrapingError', proxy)
+                    logger.error(f'Empty profile | {username}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}')
+                    await self._run_blocking(update_proxy_stats, 'ProfileScrapingError', proxy)
+                    self.proxy_pool.release(lease, ok=False)
                     fail_counter += 1
-                    time.sleep(random() * 5)
+                    await asyncio.sleep(random() * 5)
                 else:  # ok
-                    logger.info(f'Saving profile | {username}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}')
-                    log_scraping_profile(self.session_id, 'ok', 'profile', username, proxy=proxy)
-                    save_a_profile(profile_df)
-                    update_proxy_stats('ok', proxy)
-                    self._release_proxy_server(proxy)
+                    logger.info(f'Saving profile | {username}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}')
+                    await self._run_blocking(log_scraping_profile, self.session_id, 'ok', 'profile', username, proxy=proxy)
+                    await self._run_blocking(save_a_profile, profile_df)
+                    await self._run_blocking(update_proxy_stats, 'ok', proxy)
+                    self.proxy_pool.release(lease, duration=duration, task='profile')
+                    self.totals['profiles_ok'] += 1
                     break
             finally:
                 if fail_counter >= self.max_fails:  # Dead
-                    txt = f'dead | {username}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}'
+                    txt = f'dead | {username}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}'
                     logger.error(txt)
-                    log_scraping_profile(self.session_id, 'dead', f'profile', username, proxy=proxy)
-        log_scraping_profile(self.session_id, 'end', 'profile', username)
+                    await self._run_blocking(log_scraping_profile, self.session_id, 'dead', f'profile', username, proxy=proxy)
+                    self.totals['profiles_dead'] += 1
+        await self._run_blocking(log_scraping_profile, self.session_id, 'end', 'profile', username)
 
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # TWEETS
     # ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    def scrape_a_user_tweets(self, username, session_begin_date, session_end_date):
-        log_scraping_tweets(self.session_id, 'begin', 'session', username, self.session_begin_date, self.session_end_date)
-
-        periods_to_scrape = self._calculate_scrape_periods(username, session_begin_date, session_end_date)
-        for period_begin_date, period_end_date in periods_to_scrape:
-            self._check_proxy_queue()
-            fail_counter = 0
-            while fail_counter < self.max_fails:
-                proxy = self.proxy_queue.get()
-                tweet_scraper = TweetScraper(self.c)
-                tweet_scraper.proxy_server = proxy
+    async def _plan_tweets_tasks(self, iterable, semaphore):
+        """
+        Expands every (username, session_begin_date, session_end_date) into its (username, period_begin_date, period_end_date) tasks.
+        They're all put in one queue. All workers pull from it, so a user with many periods doesn't keep a single worker busy while the others are idle.
+        """
+        tasks = []
+        if not iterable: return tasks
+
+        async def _plan_a_user(username, session_begin_date, session_end_date):
+            async with semaphore:
+                await self._run_blocking(log_scraping_tweets, self.session_id, 'begin', 'session', username, self.session_begin_date, self.session_end_date)
+                periods_to_scrape = await self._run_blocking(self._calculate_scrape_periods, username, session_begin_date, session_end_date)
+                await self._run_blocking(journal_tweets_tasks, self.session_id, [(username, b, e) for b, e in periods_to_scrape])
+                await self._run_blocking(session_user_planned, self.session_id, username)
+            # Rescraping can have more than one session period for the same user
+            self.n_periods_left[username] = self.n_periods_left.get(username, 0) + len(periods_to_scrape)
+            tasks.extend((username, period_begin_date, period_end_date) for period_begin_date, period_end_date in periods_to_scrape)
+
+        if self.incremental:  # Users with tweets from before the high-water marks existed would be scraped from session_begin_date
+            await self._run_blocking(backfill_high_water_marks)
+        await asyncio.gather(*[_plan_a_user(*args) for args in iterable])
+        for username, n_periods in self.n_periods_left.items():
+            if not n_periods:
+                await self._run_blocking(log_scraping_tweets, self.session_id, 'end', 'session', username, self.session_begin_date, self.session_end_date)
+        return tasks
+
+    def _resume_tweets_tasks(self):
+        tasks = []
+        for _, (username, period_begin_date, period_end_date) in self.resume_tasks_df.iterrows():
+            self.n_periods_left[username] = self.n_periods_left.get(username, 0) + 1
+            tasks.append((username, period_begin_date, period_end_date))
+        return tasks
+
+    async def _schedule_tweets_tasks(self, tasks):
+        """
+        Puts the tasks in the queue in the order they should be scraped.
+        'activity': the periods with the most expected tweets first, so that the most valuable data is in when the time budget runs out.
+                    The expected nr of tweets is the user's tweets per day rate times the nr of days of the period.
+        """
+        if self.schedule == 'activity':
+            rates = await self._run_blocking(get_tweets_per_day_rates, self.activity_days)
+            tasks.sort(key=lambda t: rates.get(t[0], 0) * ((t[2] - t[1]).days + 1), reverse=True)
+        task_queue = asyncio.Queue()
+        for task in tasks:
+            task_queue.put_nowait(task)
+        return task_queue
+
+    async def _tweets_worker(self, task_queue):
+        # All tasks are queued before the workers start, so an empty queue means the work is done
+        while not task_queue.empty():
+            if self.time_budget and time.monotonic() - self.started_at > self.time_budget:
+                logger.warning(f'Time budget exceeded. Worker stops with {task_queue.qsize()} periods left | session_id={self.session_id}')
+                return
+            username, period_begin_date, period_end_date = task_queue.get_nowait()
+            await self.scrape_a_period_tweets(username, period_begin_date, period_end_date)
+
+    async def scrape_a_period_tweets(self, username, period_begin_date, period_end_date):
+        fail_counter = 0
+        while fail_counter < self.max_fails:
+            lease = await self.proxy_pool.acquire()
+            proxy = lease.proxy
+            logger.info(
+                f'Start scraping tweets | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}')
+            try:
+                start_time = time.monotonic()
+                async with self.proxy_pool.renewing(lease):
+                    tweets_df = await self.tweet_scraper.execute_scraping_async(username, period_begin_date, period_end_date, proxy_server=proxy,
+                                                                                 throttle=functools.partial(self.proxy_pool.wait_for_token, lease))
+                duration = time.monotonic() - start_time
+            except ValueError as e:
+                fail_counter += 1
+                await self._handle_error('ValueError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except ServerDisconnectedError as e:
+                fail_counter += 1
+                await self._handle_error('ServerDisconnectedError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except ClientOSError as e:
+                fail_counter += 1
+                await self._handle_error('ClientOSError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except TimeoutError as e:
+                fail_counter += 1
+                await self._handle_error('TimeoutError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except ClientHttpProxyError as e:
+                fail_counter += 1
+                await self._handle_error('ClientHttpProxyError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except ConnectionRefusedError as e:
+                fail_counter += 1
+                await self._handle_error('ConnectionRefusedError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except ClientProxyConnectionError as e:
+                fail_counter += 1
+                await self._handle_error('ClientProxyConnectionError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except CancelledError as e:
+                fail_counter += 1
+                await self._handle_error('CancelledError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except IndexError as e:
+                fail_counter += 1
+                await self._handle_error('IndexError', e, username, lease, fail_counter, period_begin_date, period_end_date)
+            except asyncio.CancelledError:  # The session is stopped, not a fail
+                self.proxy_pool.release(lease, ok=False)
+                raise
+            except Exception as e:
+                fail_counter += 1
+                await self._handle_error(type(e).__name__, e, username, lease, fail_counter, period_begin_date, period_end_date)
+            else:
                 logger.info(
-                    f'Start scraping tweets | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}')
-                try:
-                    tweets_df = tweet_scraper.execute_scraping(username, period_begin_date, period_end_date)
-                except ValueError as e:
-                    fail_counter += 1
-                    self._handle_error('ValueError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except ServerDisconnectedError as e:
-                    fail_counter += 1
-                    self._handle_error('ServerDisconnectedError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except ClientOSError as e:
-                    fail_counter += 1
-                    self._handle_error('ClientOSError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except TimeoutError as e:
-                    fail_counter += 1
-                    self._handle_error('TimeoutError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except ClientHttpProxyError as e:
-                    fail_counter += 1
-                    self._handle_error('ClientHttpProxyError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except ConnectionRefusedError as e:
-                    fail_counter += 1
-                    self._handle_error('ConnectionRefusedError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except ClientProxyConnectionError as e:
-                    fail_counter += 1
-                    self._handle_error('ClientProxyConnectionError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except CancelledError as e:
-                    fail_counter += 1
-                    self._handle_error('CancelledError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except IndexError as e:
-                    fail_counter += 1
-                    self._handle_error('IndexError', e, username, proxy, fail_counter, period_begin_date, period_end_date)
-                except Empty as e:  # Queue emprt
-                    logger.error(
-                        f'Empty Error | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}')
-                    self._populate_proxy_queue()
-                except:
-                    print('x' * 100)
-                    print(sys.exc_info()[0])
-                    print(sys.exc_info())
-                    print('x' * 100)
-                else:
-                    logger.info(
-                        f'Saving {len(tweets_df)} tweets | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}')
-                    if not tweets_df.empty: save_tweets(tweets_df)
-                    log_scraping_tweets(self.session_id, 'ok', 'period', username, period_begin_date, end_date=period_end_date, n_tweets=len(tweets_df))
-                    update_proxy_stats('ok', proxy)
-                    self._release_proxy_server(proxy)
-                    break  # the wile-loop
-                finally:
-                    # self._release_proxy_server(proxy)
-                    if fail_counter >= self.max_fails:
-                        txt = f'Dead | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}'
-                        logger.error(txt)
-                        log_scraping_tweets(self.session_id, 'dead', 'period', username, period_begin_date, period_end_date, n_tweets=-1)
-
-        # All periods scraped.
-        log_scraping_tweets(self.session_id, 'end', 'session', username, self.session_begin_date, self.session_end_date)
-
-    def _handle_error(self, flag, e, username, proxy, fail_counter, period_begin_date=None, period_end_date=None):
-        txt = f'{flag} | {username}, {period_begin_date}/{period_end_date}, {proxy["ip"]}:{proxy["port"]}, queue={self.proxy_queue.qsize()}, fail={fail_counter}'
+                    f'Saving {len(tweets_df)} tweets | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}')
+                # The period is only logged 'ok' after the writer saved its tweets
+                await self._run_blocking(self.tweet_writer.put, tweets_df, (username, period_begin_date, period_end_date, len(tweets_df)))
+                await self._run_blocking(update_proxy_stats, 'ok', proxy)
+                # Twint fetches the tweets in pages of 20, so the duration is compared per page
+                self.proxy_pool.release(lease, duration=duration, task='tweets', n_units=math.ceil(len(tweets_df) / 20))
+                break  # the wile-loop
+            finally:
+                if fail_counter >= self.max_fails:
+                    txt = f'Dead | {username}, {period_begin_date} | {period_end_date}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}'
+                    logger.error(txt)
+                    await self._run_blocking(log_scraping_tweets, self.session_id, 'dead', 'period', username, period_begin_date, period_end_date, n_tweets=-1)
+                    await self._run_blocking(journal_tweets_task_done, self.session_id, username, period_begin_date, period_end_date, 'dead')
+                    await self._run_blocking(self._period_done, username)
+                    self.totals['periods_dead'] += 1
+
+    def _periods_saved(self, periods):
+        # Called by the tweet writer, in its on_saved thread, with the periods of a saved batch: [(username, period_begin_date, period_end_date, n_tweets), ...]
+        for username, period_begin_date, period_end_date, n_tweets in periods:
+            log_scraping_tweets(self.session_id, 'ok', 'period', username, period_begin_date, end_date=period_end_date, n_tweets=n_tweets)
+        journal_tweets_tasks_done(self.session_id, [period[:3] for period in periods], 'ok')
+        mark_periods_scraped([period[:3] for period in periods])
+        for username, period_begin_date, period_end_date, n_tweets in periods:
+            self.totals['periods_ok'] += 1
+            self.totals['tweets'] += n_tweets
+            self._period_done(username)
+
+    def _period_done(self, username):
+        # A period is done when its tweets are saved or when it's dead. A period whose tweets couldn't be written is left, so it's resumed.
+        with self._n_periods_left_lock:
+            self.n_periods_left[username] -= 1
+            n_periods_left = self.n_periods_left[username]
+        if not n_periods_left:  # All periods of the user done
+            log_scraping_tweets(self.session_id, 'end', 'session', username, self.session_begin_date, self.session_end_date)
+
+    async def _handle_error(self, flag, e, username, lease, fail_counter, period_begin_date=None, period_end_date=None):
+        proxy = lease.proxy
+        txt = f'{flag} | {username}, {period_begin_date}/{period_end_date}, {proxy["ip"]}:{proxy["port"]}, pool={self.proxy_pool}, fail={fail_counter}'
         logger.warning(txt)
         logger.warning(e)
-        update_proxy_stats(flag, proxy)
-        # time.sleep(10)
-
-    def _release_proxy_server(self, proxy):
-        logger.info(f'Put back proxy {proxy["ip"]}:{proxy["port"]}')
-        self.proxy_queue.put({'ip': proxy['ip'], 'port': proxy['port']})
-
-    def _check_proxy_queue(self):
-        if self.proxy_queue.qsize() <= 1:
-            logger.debug(f' | proxies queue length: {self.proxy_queue.qsize()}')
-            self._populate_proxy_queue()
+        await self._run_blocking(update_proxy_stats, flag, proxy)
+        self.proxy_pool.release(lease, ok=False)
 
     # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -315,22 +502,71 @@ class TwitterScrapingSession:
                             splitted_periods.append((b, e))
             return splitted_periods
 
+        def _split_periods_adaptive(periods):
+            """
+            Splits and merges the periods so that each one is expected to contain about 'target_tweets' tweets.
+            The expected nr of tweets of a day is the nr of tweets stored in the database, or the profile's average nr of tweets per day when there are none.
+            Dense periods are split finer. Sparse periods are merged with their neighbours, as long as the days in between don't bring too many tweets,
+            and are never longer than 'max_time_delta' days.
+            """
+            if not periods: return []
+            begin_date, end_date = periods[0][0], periods[-1][1]
+            days_to_scrape = {b + timedelta(days=i) for b, e in periods for i in range((e - b).days + 1)}
+
+            nr_tweets_per_day = get_nr_tweets_per_day(username, datetime.combine(begin_date, datetime.min.time()), datetime.combine(end_date, datetime.max.time()))
+            nr_tweets_per_day = {} if nr_tweets_per_day.empty else {d.date(): n for d, n in zip(nr_tweets_per_day['date'], nr_tweets_per_day['nr_tweets'])}
+            avg_tweets_per_day = get_avg_tweets_per_day(username)
+            if avg_tweets_per_day is None:  # No profile counter: fall back on periods of 'time_delta' days
+                avg_tweets_per_day = self.target_tweets / self.timedelta
+
+            adaptive_periods = []
+            b, e, n_tweets = None, None, 0
+            for day in (begin_date + timedelta(days=i) for i in range((end_date - begin_date).days + 1)):
+                expected_tweets = nr_tweets_per_day.get(day, avg_tweets_per_day)
+                if b is not None and (n_tweets + expected_tweets > self.target_tweets or (day - b).days >= self.max_time_delta):
+                    adaptive_periods.append((b, e))
+                    b = None
+                if day in days_to_scrape:
+                    if b is None: b, n_tweets = day, 0
+                    e = day
+                if b is not None: n_tweets += expected_tweets  # Days between two periods are also scraped when the periods get merged
+            if b is not None: adaptive_periods.append((b, e))
+            return adaptive_periods
+
+        # only scrape from the newest stored tweet on, or from after the days since then that were all scraped already (users that don't tweet),
+        # minus 'incremental_overlap' days. It only narrows the session period. Rescraping dead periods ignores it, they're older.
+        if self.incremental and not self.rescrape:
+            high_water_mark = get_high_water_mark(username)
+            scrape_from_date = high_water_mark[0].date() if high_water_mark else session_begin_date
+            scraped_through_date = get_scraped_through_date(username, scrape_from_date)
+            if scraped_through_date:
+                scrape_from_date = scraped_through_date + timedelta(days=1)
+            session_begin_date = max(session_begin_date, scrape_from_date - timedelta(days=self.incremental_overlap))
+
         # no need to start before join_date
         join_date = get_join_date(username)
         session_begin_date, session_end_date = max(session_begin_date, join_date.date()), min(session_end_date, datetime.today().date())
+        if session_begin_date > session_end_date: return []
 
-        # no need to start same dates again
+        # no need to start same dates again. The coverage bitmap knows which days were scraped, also the ones without tweets.
+        # Users scraped before the bitmap existed fall back on the days with less than 'min_tweets' tweets.
         if self.missing_dates:
-            scrape_periods = _get_periods_without_min_tweets(username, session_begin_date=session_begin_date, session_end_date=session_end_date)
+            scrape_periods = get_periods_not_scraped(username, session_begin_date, session_end_date)
+            if scrape_periods is None:
+                scrape_periods = _get_periods_without_min_tweets(username, session_begin_date=session_begin_date, session_end_date=session_end_date)
         else:
             scrape_periods = [(session_begin_date, session_end_date)]
-        scrape_periods = _split_periods(scrape_periods)
+        if self.period_sizing == 'adaptive':
+            scrape_periods = _split_periods_adaptive(scrape_periods)
+        else:
+            scrape_periods = _split_periods(scrape_periods)
         return scrape_periods
 
     # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    def _populate_proxy_queue(self):
-
+    @staticmethod
+    def _get_proxies():
+        # Called by the proxy pool when it needs to be populated
         update_proxies_ratio()
         proxy_df = get_proxies()
         columns = ['datetime', 'ip', 'port', 'source', 'delay', 'blacklisted', 'scrape_n_failed', 'scrape_n_used',
@@ -338,9 +574,10 @@ class TwitterScrapingSession:
         # Sort by ratio
         proxy_df.sort_values('fail_ratio', inplace=True)
         print(proxy_df[columns])
-        for _, proxy in proxy_df.iterrows():
-            self.proxy_queue.put({'ip': proxy['ip'], 'port': proxy['port']})
-        logger.warning(f'Proxy queue poulated. Contains {self.proxy_queue.qsize()} servers')
+        # The ProxyPool uses delay and the totals for the Thompson sampling
+        proxy_df = proxy_df.reindex(columns=['ip', 'port', 'delay', 'scrape_n_used_total', 'scrape_n_failed_total'])
+        proxy_df[['delay', 'scrape_n_used_total', 'scrape_n_failed_total']] = proxy_df[['delay', 'scrape_n_used_total', 'scrape_n_failed_total']].fillna(0)
+        return proxy_df.to_dict('records')
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
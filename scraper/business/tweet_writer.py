@@ -0,0 +1,90 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - tweet_writer.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from scraper.database.twitter_facade import save_tweets
+from tools.logger import logger
+
+
+class TweetWriter(threading.Thread):
+    """
+    Saves the scraped tweets in its own thread, so that fetching tweets and writing them to the database overlap.
+
+    Scrapers put (tweets_df, item) in a bounded queue. When the queue is full, put() blocks until the writer caught up.
+    That's the backpressure when the database falls behind.
+    The tweets of several puts are saved together when 'batch_size' tweets are waiting or when 'flush_interval' seconds have passed.
+    After a batch is saved, on_saved(items) is called with the items of its puts, so their bookkeeping can be written in bulk too.
+    It runs in an other thread, one batch at a time in order, so the writer goes on with the next batch meanwhile.
+    When saving fails or some tweets of the batch couldn't be written, on_saved isn't called for that batch.
+    """
+
+    def __init__(self, batch_size=5000, flush_interval=5, max_queue_size=100, on_saved=None):
+        super(TweetWriter, self).__init__(name='TweetWriter', daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_saved = on_saved
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._on_saved_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='TweetWriterOnSaved')
+
+    def put(self, tweets_df, item=None):
+        self._queue.put((tweets_df, item))
+
+    def close(self):
+        # Saves what's still waiting, stops the thread and waits until on_saved is done
+        self._queue.put(None)
+        self.join()
+        self._on_saved_executor.shutdown(wait=True)
+
+    def run(self):
+        batch, items, n_tweets = [], [], 0
+        flush_at = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(flush_at - time.monotonic(), 0))
+            except queue.Empty:
+                item = ()
+            if item:
+                tweets_df, put_item = item
+                if not tweets_df.empty: batch.append(tweets_df)
+                if put_item is not None: items.append(put_item)
+                n_tweets += len(tweets_df)
+            if item is None or n_tweets >= self.batch_size or time.monotonic() >= flush_at:
+                self._flush(batch, items, n_tweets)
+                batch, items, n_tweets = [], [], 0
+                flush_at = time.monotonic() + self.flush_interval
+            if item is None:
+                break
+
+    def _flush(self, batch, items, n_tweets):
+        if not (batch or items): return
+        try:
+            if batch:
+                logger.info(f'Writing {n_tweets} tweets of {len(items)} periods')
+                result = save_tweets(pd.concat(batch, ignore_index=True))
+                if result['errors']:
+                    logger.error(f'Writing {n_tweets} tweets of {len(items)} periods failed: {result}')
+                    return
+        except:
+            logger.error(f'Writing {n_tweets} tweets failed: {sys.exc_info()}')
+            return
+        if items and self.on_saved:
+            self._on_saved_executor.submit(self._call_on_saved, items)
+
+    def _call_on_saved(self, items):
+        try:
+            self.on_saved(items)
+        except:
+            logger.error(f'on_saved after writing tweets failed: {sys.exc_info()}')
+
+
+if __name__ == '__main__':
+    pass
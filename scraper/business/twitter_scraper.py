@@ -3,15 +3,22 @@
 # src - twitter_scraper.py
 # md
 # --------------------------------------------------------------------------------------------------------
+import asyncio
+import contextvars
+import copy
 from datetime import datetime, timedelta
+from time import localtime, strftime
 
+import pandas as pd
 import twint
-import twint.output
-import twint.storage.panda
+import twint.get
+import twint.user
+from bs4 import BeautifulSoup
 
 # from business.proxy_manager import get_a_proxy_server
 # from config import SCRAPE_WITH_PROXY
 from config import LOG_LEVEL
+from tools.logger import logger
 from tools.utils import set_pandas_display_options
 
 set_pandas_display_options()
@@ -25,29 +32,123 @@ cfg = {
     'twint_show_count': True,  # Count the total number of Tweets fetched.
     'twint_show_hashtags': False,  # Set to True to show hashtags in the terminal output.
     'twint_show_cashtags': False,  # Set to True to show cashtags in the terminal output.
-    'twint_pandas_clean': True,  # Automatically clean Pandas dataframe at every start.
     'twint_geo': False
 
 }
 
 
+# The proxy of the scrape that runs in the current asyncio task, and the coroutine function it awaits before every request, e.g. a rate limit
+_proxy_url = contextvars.ContextVar('twint_proxy_url', default=None)
+_throttle = contextvars.ContextVar('twint_throttle', default=None)
+
+
+async def _twint_response(session, url, params=[]):
+    """
+    Replaces twint.get.Response. That one takes the http proxy from the module global twint.get.httpproxy,
+    which twint.get.get_connector overwrites at every request. So concurrent scrapes would all use the proxy that was set last.
+    This one takes the proxy from _proxy_url, which belongs to the task of one scrape. Same timeout of 120 s.
+    twint requests a page of 20 tweets at a time, so the scrape's _throttle is awaited here, once per request.
+    """
+    throttle = _throttle.get()
+    if throttle: await throttle()
+
+    async def _get():
+        async with session.get(url, ssl=True, params=params, proxy=_proxy_url.get()) as response:
+            return await response.text()
+
+    return await asyncio.wait_for(_get(), 120)
+
+
+twint.get.Response = _twint_response
+
+_weekdays = {'Monday': 1, 'Tuesday': 2, 'Wednesday': 3, 'Thursday': 4, 'Friday': 5, 'Saturday': 6, 'Sunday': 7}
+
+
+def _tweets_to_df(tweets, search):
+    # Same columns as twint's Pandas Tweets_df, but built from the tweets captured by a single twint run
+    rows = []
+    for t in tweets:
+        date = f'{t.datestamp} {t.timestamp}'
+        created_at = datetime.strptime(date, '%Y-%m-%d %H:%M:%S').timestamp() * 1000
+        rows.append({'id': str(t.id),
+                     'conversation_id': t.conversation_id,
+                     'created_at': created_at,
+                     'date': date,
+                     'timezone': t.timezone,
+                     'place': t.place,
+                     'tweet': t.tweet,
+                     'hashtags': t.hashtags,
+                     'cashtags': t.cashtags,
+                     'user_id': t.user_id,
+                     'user_id_str': t.user_id_str,
+                     'username': t.username,
+                     'name': t.name,
+                     'day': _weekdays[strftime('%A', localtime(created_at / 1000))],
+                     'hour': strftime('%H', localtime(created_at / 1000)),
+                     'link': t.link,
+                     'urls': t.urls,
+                     'photos': t.photos,
+                     'video': t.video,
+                     'thumbnail': t.thumbnail,
+                     'retweet': t.retweet,
+                     'nlikes': int(t.likes_count),
+                     'nreplies': int(t.replies_count),
+                     'nretweets': int(t.retweets_count),
+                     'quote_url': t.quote_url,
+                     'search': str(search),
+                     'near': t.near,
+                     'geo': t.geo,
+                     'source': t.source,
+                     'user_rt_id': t.user_rt_id,
+                     'user_rt': t.user_rt,
+                     'retweet_id': t.retweet_id,
+                     'reply_to': t.reply_to,
+                     'retweet_date': t.retweet_date,
+                     'translate': t.translate,
+                     'trans_src': t.trans_src,
+                     'trans_dest': t.trans_dest})
+    return pd.DataFrame(rows)
+
+
+def _profiles_to_df(users):
+    # Same columns as twint's Pandas User_df, but built from the users captured by a single twint run
+    rows = []
+    for u in users:
+        rows.append({'id': u.id,
+                     'name': u.name,
+                     'username': u.username,
+                     'bio': u.bio,
+                     'url': u.url,
+                     'join_datetime': f'{u.join_date} {u.join_time}',
+                     'join_date': u.join_date,
+                     'join_time': u.join_time,
+                     'tweets': u.tweets,
+                     'location': u.location,
+                     'following': u.following,
+                     'followers': u.followers,
+                     'likes': u.likes,
+                     'media': u.media_count,
+                     'private': u.is_private,
+                     'verified': u.is_verified,
+                     'avatar': u.avatar,
+                     'background_image': getattr(u, 'background_image', '')})
+    return pd.DataFrame(rows)
+
+
 class _TwitterScraper:
     """
     Base class to start twitter tweets and profile for a username and send that data to the the scraping_controller for further handeling
+
+    A scraper doesn't keep any state of a scrape. Every call gets its own twint.Config, copied from the one made in __init__,
+    with its own lists that twint stores the results in. twint.storage.panda and its module globals aren't used.
+    The proxy of a call is set in _proxy_url, a context variable of its task, and used by _twint_response.
+    So one scraper can be reused for all periods, users and retries, and it can run many scrapes at the same time in one process.
     """
     _name = ''
-    _twint_command = None  # twint.run.Search for tweets or twint.run.Lookup for profiles
+    _twint_flags = {}  # The config flags that twint.run.Search would set before running twint
 
-    # def __init__(self, username, begin_date=datetime(2000, 1, 1), end_date=datetime(2035, 1, 1)):
     def __init__(self, config=None):
-        if config: cfg.update(config)
-        self.c = cfg
-
-        self.proxy_server = None
-
-        self.username = None
-        self.begin_date = None
-        self.end_date = None
+        self.c = dict(cfg, **config) if config else dict(cfg)
 
         # twint config parameters (see https://github.com/twintproject/twint/wiki/Configuration)
         # Todo: FORK TWINT AND MODIFY IT!!!
@@ -64,32 +165,31 @@ class _TwitterScraper:
         self.twint_show_count = self.c['twint_show_count']
         self.twint_show_hashtags = self.c['twint_show_hashtags']
         self.twint_show_cashtags = self.c['twint_show_cashtags']
-        self.twint_pandas_clean = self.c['twint_pandas_clean']
         self.twint_geo = self.c['twint_geo']
 
-    def execute_scraping(self, username, period_begin_date=None, period_end_date=None):
-        if not self._twint_command: print('Error. Did you use the base class _TwitterScraper? Try TweetScraper or ProfileScraper instead!')
-        self.username = username
-        self.begin_date = period_begin_date
-        self.end_date = period_end_date
+        self._twint_config = self._make_twint_config()
 
-        scraped_df = self._scrape_using_twint()
+    def execute_scraping(self, username, period_begin_date=None, period_end_date=None, proxy_server=None, throttle=None):
+        return asyncio.run(self.execute_scraping_async(username, period_begin_date, period_end_date, proxy_server, throttle))
 
-        return scraped_df
+    async def execute_scraping_async(self, username, period_begin_date=None, period_end_date=None, proxy_server=None, throttle=None):
+        """
+        Awaits twint on the running event loop so that many scrapes can run concurrently in one process.
+        proxy_server = {'ip': ip, 'port': port} or None
+        throttle = a coroutine function without arguments that is awaited before every request, or None
+        """
+        if not self._name: print('Error. Did you use the base class _TwitterScraper? Try TweetScraper or ProfileScraper instead!')
+        c = self._make_call_config(username, period_begin_date, period_end_date, proxy_server)
+        # Tasks that twint starts, copy the context of this task with the proxy
+        _proxy_url.set(f'http://{proxy_server["ip"]}:{proxy_server["port"]}' if proxy_server else None)
+        _throttle.set(throttle)
+        return await self._scrape(c)
 
-    def _scrape_using_twint(self):
-        c = self._make_twint_config()
-        twint.storage.panda.clean()
-
-        self._twint_command(c)
-
-        # Get both tweets_df and profile; One of them will be None
-        tweets_df = twint.storage.panda.Tweets_df
-        profile_df = twint.storage.panda.User_df
-        twitter_df = tweets_df if profile_df is None else profile_df
-        return twitter_df
+    async def _scrape(self, c):
+        raise NotImplementedError
 
     def _make_twint_config(self):
+        # The part of the config that is the same for every call
         c = twint.Config()
         c.Limit = self.twint_limit
         c.Geo = self.twint_geo
@@ -100,17 +200,23 @@ class _TwitterScraper:
         c.Debug = self.twint_debug
         c.Hide_output = self.twint_hide_terminal_output
         c.Retries_count = self.twint_retries
-        c.Pandas_clean = self.twint_pandas_clean
-        c.Username = self.username
-        c.Pandas = True
+        for flag, value in self._twint_flags.items():
+            setattr(c, flag, value)
+        c.Pandas, c.Pandas_clean = False, False
+        c.Store_object = True
+        return c
+
+    def _make_call_config(self, username, begin_date, end_date, proxy_server):
+        c = copy.copy(self._twint_config)
+        c.Username = username
+        c.Store_object_tweets_list = []
         if self._name == 'tweets':
-            # Todo: Patch: if Since and Until are the same date (scraping 1 day) then 0 tweets returned
-            if self.begin_date == self.end_date:
-                self.end_date += timedelta(days=1)
-            c.Since = datetime.strftime(self.begin_date, '%Y-%m-%d')
-            c.Until = datetime.strftime(self.end_date, '%Y-%m-%d')
-        if self.proxy_server:
-            c.Proxy_host, c.Proxy_port = self.proxy_server['ip'], self.proxy_server['port']
+            # Until is exclusive (Since == Until returns 0 tweets), the periods include their end_date
+            c.Since = datetime.strftime(begin_date, '%Y-%m-%d')
+            c.Until = datetime.strftime(end_date + timedelta(days=1), '%Y-%m-%d')
+        if proxy_server:
+            # Only for twint's own checks. The requests take the proxy from _proxy_url.
+            c.Proxy_host, c.Proxy_port = proxy_server['ip'], proxy_server['port']
             c.Proxy_type = 'http'
         c.User_id = None  # Bugfix twint
         return c
@@ -119,16 +225,36 @@ class _TwitterScraper:
 class TweetScraper(_TwitterScraper):
     def __init__(self, config):
         self._name = 'tweets'
-        self._twint_command = twint.run.Search
+        self._twint_flags = {'TwitterSearch': True, 'Favorites': False, 'Following': False, 'Followers': False, 'Profile': False, 'Profile_full': False}
         super(TweetScraper, self).__init__(config)
 
+    async def _scrape(self, c):
+        await twint.run.Twint(c).main()
+        return _tweets_to_df(c.Store_object_tweets_list, c.Search)
+
 
 class ProfileScraper(_TwitterScraper):
+    """
+    twint.run.Lookup runs its own event loop and only stores the profile in twint's module globals (Pandas or output.users_list).
+    So the profile page is requested and parsed here, the same way twint.get.User does it, and the profile is kept by this call.
+    A profile that can't be fetched or parsed gives an empty df, like twint.get.User that only logs the error.
+    """
+
     def __init__(self, config):
         self._name = 'profile'
-        self._twint_command = twint.run.Lookup
+        self._twint_flags = {'Profile': False, 'Favorites': False, 'Following': False, 'Followers': False, 'TwitterSearch': False}
         super(ProfileScraper, self).__init__(config)
 
+    async def _scrape(self, c):
+        url = f'https://twitter.com/{c.Username}?lang=en'
+        try:
+            response = await twint.get.Request(url, connector=twint.get.get_connector(c))
+            user = twint.user.User(BeautifulSoup(response, 'html.parser'))
+        except Exception as e:
+            logger.debug(f'Profile lookup failed | {c.Username}: {e!r}')
+            return _profiles_to_df([])
+        return _profiles_to_df([user])
+
 
 if __name__ == '__main__':
     pass
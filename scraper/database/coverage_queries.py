@@ -0,0 +1,80 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - coverage_queries.py
+# md
+# --------------------------------------------------------------------------------------------------------
+from datetime import datetime
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
+
+"""
+Group of queries to store and retrief the scraping coverage of the users.
+Every user has one document with a bitmap of the days that were scraped successfully. See twitter_facade for the bitmap itself.
+The document has a version that is incremented at every update, so concurrent updates don't overwrite each other.
+The queries start with 'q_' 
+Queries accept and return a dict or a lists of dicts when suitable
+
+Convention:
+-----------
+- documnet:     d
+- query:        q
+- projection:   p
+- sort:         s
+- filter:       f
+- update:       u
+- pipeline      pl
+- match         m
+- group:        g
+
+IMPLEMENTED QUERIES
+-------------------
+- q_get_coverage(username)
+- q_update_coverage(username, bitmap, version)
+"""
+
+database = DATABASE
+collection_name = 'coverage'
+
+
+def get_collection():
+    client = get_client()
+    db = client[database]
+    collection = db[collection_name]
+    return collection
+
+
+def setup_collection():
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
+
+
+def q_get_coverage(username):
+    collection = get_collection()
+    q = {'username': username}
+    p = {'_id': 0, 'bitmap': 1, 'version': 1}
+    doc = collection.find_one(q, p)
+    return doc
+
+
+def q_update_coverage(username, bitmap, version):
+    # Returns False when the document was changed since it was read with 'version'. Version 0 means there was no document.
+    collection = get_collection()
+    f = {'username': username,
+         'version': version}
+    u = {'$set': {'bitmap': Binary(bitmap),
+                  'timestamp': datetime.now()},
+         '$inc': {'version': 1}}
+    try:
+        result = collection.update_one(f, u, upsert=(version == 0))
+    except DuplicateKeyError:  # An other process created the document first
+        return False
+    return bool(result.matched_count or result.upserted_id)
+
+
+if __name__ == '__main__':
+    pass
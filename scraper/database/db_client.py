@@ -0,0 +1,48 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - db_client.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import os
+import threading
+
+from pymongo import MongoClient
+
+from config import MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_COMPRESSORS, MONGO_WRITE_CONCERN
+
+"""
+The MongoClient that all the queries share.
+A MongoClient has its own connection pool and does the server discovery and handshakes once, so there is only one per process.
+MongoClient isn't fork-safe: a forked child process (ex. a mp.Pool worker) creates a new one the first time it needs it.
+"""
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(MONGO_URI,
+                                      maxPoolSize=MONGO_MAX_POOL_SIZE,
+                                      compressors=MONGO_COMPRESSORS,
+                                      w=MONGO_WRITE_CONCERN,
+                                      connect=False)  # Connect at the first query, not at import
+                _client_pid = os.getpid()
+    return _client
+
+
+def _reset_after_fork():
+    # The parent's client and lock are copied into the child, but they can't be used there
+    global _client, _client_pid, _lock
+    _client, _client_pid, _lock = None, None, threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+if __name__ == '__main__':
+    pass
@@ -29,10 +29,9 @@ IMPLEMENTED QUERIES AND FUNCTIONS
 # - q_copy_field
 """
 
-from pymongo import MongoClient
-
 # from config import DATABASE
 from config import DATABASE
+from scraper.database.db_client import get_client
 from tools.logger import logger
 
 database = DATABASE
@@ -40,8 +39,8 @@ database = DATABASE
 
 # Todo: Refactor: put everything in a class. DbManagement.copy_collection().xxx
 
-def get_collection(collection_name):  # Todo: same function in many modules. Put in tools?
-    client = MongoClient()
+def get_collection(collection_name):
+    client = get_client()
     db = client[database]
     collection = db[collection_name]
     return collection
@@ -0,0 +1,119 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - indexes.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import sys
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from config import DATABASE
+from scraper.database.db_client import get_client
+from tools.logger import logger
+
+"""
+The registry of the indexes of all collections and of the queries that should use them.
+
+- indexes:  collection_name: [IndexModel, ...]
+- queries:  the filters and sorts of the queries in scraper/database, with example values.
+            Queries that read or update the whole collection on purpose aren't registered.
+
+setup_indexes() creates the missing indexes. Indexes that already exist are left alone, so it can run at every start.
+check_query_plans() explains every registered query and returns the ones whose plan contains a COLLSCAN.
+
+python -m scraper.database.indexes          creates the indexes
+python -m scraper.database.indexes check    creates the indexes and checks the query plans. Exits with 1 on a COLLSCAN.
+"""
+
+database = DATABASE
+
+indexes = {
+    'tweets': [IndexModel([('tweet_id', ASCENDING)], unique=True),
+               IndexModel([('username', ASCENDING), ('datetime', ASCENDING)]),
+               IndexModel([('datetime', ASCENDING)])],
+    'profiles': [IndexModel([('username', ASCENDING)]),
+                 IndexModel([('user_id', ASCENDING)])],
+    'logs': [IndexModel([('session_id', DESCENDING)]),
+             IndexModel([('session_id', ASCENDING), ('task', ASCENDING), ('category', ASCENDING), ('flag', ASCENDING)]),
+             IndexModel([('username', ASCENDING), ('task', ASCENDING), ('category', ASCENDING), ('flag', ASCENDING)])],
+    'proxies': [IndexModel([('ip', DESCENDING), ('port', DESCENDING)], unique=True),
+                IndexModel([('blacklisted', ASCENDING), ('fail_ratio', ASCENDING)])],
+    'journal': [IndexModel([('session_id', ASCENDING), ('username', ASCENDING), ('period_begin_date', ASCENDING), ('period_end_date', ASCENDING)], unique=True),
+                IndexModel([('session_id', ASCENDING), ('status', ASCENDING)])],
+    'coverage': [IndexModel([('username', ASCENDING)], unique=True)],
+    'sessions': [IndexModel([('ended_at', DESCENDING)])],
+}
+
+d = datetime(2020, 1, 1)
+queries = [
+    # tweet_queries
+    {'name': 'q_get_nr_tweets_per_day', 'collection': 'tweets', 'f': {'username': 'x', 'datetime': {'$gte': d, '$lte': d}}},
+    {'name': 'q_get_nr_tweets_per_user', 'collection': 'tweets', 'f': {'datetime': {'$gte': d}}},
+    {'name': 'q_update_tweets', 'collection': 'tweets', 'f': {'tweet_id': 'x'}},
+    {'name': 'q_get_newest_tweets', 'collection': 'tweets', 'f': {'username': {'$in': ['x', 'y']}}, 's': [('username', ASCENDING), ('datetime', DESCENDING)]},
+    # profile_queries
+    {'name': 'q_get_a_profile', 'collection': 'profiles', 'f': {'username': 'x'}},
+    {'name': 'q_get_existing_usernames', 'collection': 'profiles', 'f': {'username': {'$in': ['x', 'y']}}},
+    {'name': 'q_save_a_profile', 'collection': 'profiles', 'f': {'user_id': 'x'}},
+    {'name': 'q_update_high_water_mark', 'collection': 'profiles', 'f': {'username': 'x', '$or': [{'hwm_datetime': {'$lt': d}}, {'hwm_datetime': {'$exists': False}}]}},
+    # log_queries
+    {'name': 'q_get_max_sesion_id', 'collection': 'logs', 'f': {}, 's': [('session_id', DESCENDING)]},
+    {'name': 'q_get_dead_tweets_periods_logs', 'collection': 'logs', 'f': {'session_id': 0, 'task': 'tweets', 'category': 'period', 'flag': 'dead'}},
+    {'name': 'q_get_ok_tweets_periods_logs', 'collection': 'logs', 'f': {'username': 'x', 'task': 'tweets', 'category': 'period', 'flag': 'ok'}},
+    # proxy_queries
+    {'name': 'q_get_proxies', 'collection': 'proxies', 'f': {'blacklisted': False, 'fail_ratio': {'$lte': .5}}},
+    {'name': 'q_update_a_proxy_test', 'collection': 'proxies', 'f': {'ip': 'x', 'port': 'x'}},
+    # journal_queries
+    {'name': 'q_update_journal_task', 'collection': 'journal', 'f': {'session_id': 0, 'username': 'x', 'period_begin_date': d, 'period_end_date': d}},
+    {'name': 'q_get_journal_tasks', 'collection': 'journal', 'f': {'session_id': 0, 'status': 'planned'}},
+    # coverage_queries
+    {'name': 'q_get_coverage', 'collection': 'coverage', 'f': {'username': 'x'}},
+    # session_queries
+    {'name': 'q_get_session', 'collection': 'sessions', 'f': {'_id': 0}},
+    {'name': 'q_get_last_ended_session_id', 'collection': 'sessions', 'f': {'_id': {'$gt': 0}, 'ended_at': {'$ne': None}}, 's': [('ended_at', DESCENDING)]},
+]
+
+
+def setup_indexes(collection_names=None):
+    # An index with the same keys but other options (e.g. unique) can't be created. That's logged and the other indexes are still created.
+    db = get_client()[database]
+    for collection_name, index_models in indexes.items():
+        if collection_names and collection_name not in collection_names: continue
+        if not index_models: continue
+        try:
+            db[collection_name].create_indexes(index_models)
+        except OperationFailure:
+            logger.error(f'Creating the indexes of {collection_name} failed: {sys.exc_info()[1]}')
+
+
+def check_query_plans():
+    # Returns the names of the queries whose winning plan contains a COLLSCAN
+    db = get_client()[database]
+    failed = []
+    for query in queries:
+        cursor = db[query['collection']].find(query['f'])
+        if query.get('s'): cursor = cursor.sort(query['s'])
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        if _has_stage(plan, 'COLLSCAN'):
+            logger.error(f'COLLSCAN | {query["name"]} on {query["collection"]}: {query["f"]}')
+            failed.append(query['name'])
+        else:
+            logger.info(f'Index used | {query["name"]} on {query["collection"]}')
+    return failed
+
+
+def _has_stage(plan, stage):
+    # Plans are nested dicts and lists (inputStage, inputStages, queryPlan, ...)
+    if isinstance(plan, dict):
+        return plan.get('stage') == stage or any(_has_stage(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_stage(value, stage) for value in plan)
+    return False
+
+
+if __name__ == '__main__':
+    setup_indexes()
+    if sys.argv[1:] == ['check']:
+        sys.exit(1 if check_query_plans() else 0)
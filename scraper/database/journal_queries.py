@@ -0,0 +1,106 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - journal_queries.py
+# md
+# --------------------------------------------------------------------------------------------------------
+
+
+"""
+Group of queries to store and retrief the journal of the scraping sessions.
+The journal has one document per (session_id, username, period_begin_date, period_end_date) task. Its status is 'planned', 'ok' or 'dead'.
+The queries start with 'q_'
+Queries accept and return a dict or a lists of dicts when suitable
+
+Convention:
+-----------
+- documnet:     d
+- query:        q
+- projection:   p
+- sort:         s
+- filter:       f
+- update:       u
+- pipeline      pl
+- match         m
+- group:        g
+
+IMPLEMENTED QUERIES
+-------------------
+- q_save_journal_tasks(tasks)
+- q_update_journal_task(session_id, username, period_begin_date, period_end_date, status)
+- q_update_journal_tasks(session_id, tasks, status)
+- q_get_journal_tasks(session_id, status)
+"""
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
+from tools.logger import logger
+
+database = DATABASE
+collection_name = 'journal'
+
+
+def get_collection():
+    client = get_client()
+    db = client[database]
+    collection = db[collection_name]
+    return collection
+
+
+def setup_collection():
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
+
+
+def q_save_journal_tasks(tasks):
+    collection = get_collection()
+    try:
+        collection.insert_many(tasks, ordered=False)
+    except BulkWriteError as e:  # Tasks that are already in the journal
+        logger.warning(f"Journal tasks already exist: {len(e.details['writeErrors'])}")
+
+
+def q_update_journal_task(session_id, username, period_begin_date, period_end_date, status):
+    collection = get_collection()
+    f = {'session_id': session_id,
+         'username': username,
+         'period_begin_date': period_begin_date,
+         'period_end_date': period_end_date}
+    u = {'$set': {'status': status,
+                  'timestamp': datetime.now()}}
+    collection.update_one(f, u, upsert=True)
+
+
+def q_update_journal_tasks(session_id, tasks, status):
+    # tasks = [(username, period_begin_date, period_end_date), ...], with one unordered bulk_write
+    collection = get_collection()
+    timestamp = datetime.now()
+    requests = [UpdateOne({'session_id': session_id,
+                           'username': username,
+                           'period_begin_date': period_begin_date,
+                           'period_end_date': period_end_date},
+                          {'$set': {'status': status,
+                                    'timestamp': timestamp}},
+                          upsert=True)
+                for username, period_begin_date, period_end_date in tasks]
+    if requests: collection.bulk_write(requests, ordered=False)
+
+
+def q_get_journal_tasks(session_id, status):
+    collection = get_collection()
+    f = {'session_id': session_id,
+         'status': status}
+    p = {'_id': 0,
+         'username': 1,
+         'period_begin_date': 1,
+         'period_end_date': 1}
+    cursor = collection.find(f, p).sort([('username', 1), ('period_begin_date', 1)])
+    return list(cursor)
+
+
+if __name__ == '__main__':
+    pass
@@ -3,11 +3,21 @@
 # src - log_facade.py
 # md
 # --------------------------------------------------------------------------------------------------------
-from datetime import datetime
+import atexit
+import sys
+import threading
+import time
+from datetime import date, datetime
 
 import pandas as pd
+from pymongo.errors import BulkWriteError
 
-from scraper.database.log_queries import q_save_log, q_get_max_sesion_id, q_get_dead_tweets_periods_logs
+from config import LOG_SINK_MAX_BUFFER, LOG_SINK_FLUSH_INTERVAL, LOG_SINK_MAX_RETRY_INTERVAL
+from scraper.database.journal_queries import q_save_journal_tasks, q_update_journal_task, q_update_journal_tasks, q_get_journal_tasks
+from scraper.database.log_queries import q_save_logs, q_get_max_sesion_id, q_get_dead_tweets_periods_logs
+from scraper.database.session_queries import q_get_new_session_id, q_seed_new_session_id, q_get_last_session_id, q_get_session, q_get_last_ended_session_id
+from scraper.database.session_queries import q_start_session, q_end_session, q_save_session_plan, q_add_planned_usernames
+from tools.logger import logger
 
 """
 Group of functions to store and retrieve log data via one or more queries from one or more collections.
@@ -16,10 +26,109 @@ Functions accept and return dataframes when suitable
 
 IMPLEMENTED FUNCTIONS
 ---------------------
-
+- log_scraping_profile(session_id, flag, category, username)
+- log_scraping_tweets(session_id, flag, category, username, begin_date, end_date)
+- flush_logs()
+- get_dead_tweets_periods(session_id)
+- get_max_sesion_id()
+- get_new_session_id()
+- get_last_ended_session_id()
+- get_session(session_id)
+- get_session_config(session_id)
+- start_session(session_id, config)
+- end_session(session_id, status, totals)
+- save_session_plan(session_id, plan)
+- session_user_planned(session_id, username)
+- get_unplanned_session_users(session_id)
+- journal_tweets_tasks(session_id, tasks)
+- journal_tweets_task_done(session_id, username, period_begin_date, period_end_date, status)
+- journal_tweets_tasks_done(session_id, tasks, status)
+- get_unfinished_tweets_tasks(session_id)
 """
 
 
+class _LogSink(threading.Thread):
+    """
+    Buffers the scraping logs and writes them with insert_many in a background thread,
+    every LOG_SINK_FLUSH_INTERVAL seconds or when LOG_SINK_MAX_BUFFER logs are waiting.
+    A 'dead' log is written right away, together with the logs before it. The caller waits until it's written,
+    retrying with a growing interval of at most 'max_retry_interval' seconds while the database can't be reached.
+    Logs that couldn't be written stay in the buffer and are written at the next flush. After a partial BulkWriteError, only the failed ones.
+    """
+
+    def __init__(self, max_buffer=LOG_SINK_MAX_BUFFER, flush_interval=LOG_SINK_FLUSH_INTERVAL, max_retry_interval=LOG_SINK_MAX_RETRY_INTERVAL):
+        super(_LogSink, self).__init__(name='LogSink', daemon=True)
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.max_retry_interval = max_retry_interval
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # One flush at a time, so the logs are written in order
+        self._wake_up = threading.Event()
+
+    def put(self, log):
+        with self._buffer_lock:
+            self._buffer.append(log)
+            n_logs = len(self._buffer)
+        if log['flag'] == 'dead':
+            retry_interval = .5
+            while not self.flush():
+                logger.warning(f'Writing a dead log failed, retrying in {retry_interval} s')
+                time.sleep(retry_interval)
+                retry_interval = min(retry_interval * 2, self.max_retry_interval)
+        elif n_logs >= self.max_buffer:
+            self._wake_up.set()
+
+    def flush(self):
+        # Returns False when some logs couldn't be written. They're back in the buffer.
+        with self._write_lock:
+            with self._buffer_lock:
+                logs, self._buffer = self._buffer, []
+            if not logs: return True
+            try:
+                q_save_logs(logs)
+            except BulkWriteError as e:  # The other logs are written, writing them again would duplicate them
+                failed_logs = [logs[error['index']] for error in e.details['writeErrors'] if error['code'] != 11000]  # 11000: already written
+                logger.error(f'Writing {len(failed_logs)} of {len(logs)} logs failed, retrying at the next flush: {e}')
+                self._restore(failed_logs)
+                return not failed_logs
+            except:
+                logger.error(f'Writing {len(logs)} logs failed, retrying at the next flush: {sys.exc_info()[1]}')
+                self._restore(logs)
+                return False
+            return True
+
+    def _restore(self, logs):
+        # Before the logs that were put meanwhile, so the logs are written in order
+        with self._buffer_lock:
+            self._buffer[:0] = logs
+
+    def run(self):
+        while True:
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            self.flush()
+
+
+_log_sink = None
+_log_sink_lock = threading.Lock()
+
+
+def _get_log_sink():
+    global _log_sink
+    with _log_sink_lock:
+        if _log_sink is None:
+            _log_sink = _LogSink()
+            _log_sink.start()
+            atexit.register(_log_sink.flush)
+    return _log_sink
+
+
+def flush_logs():
+    # Writes the buffered logs. Call it at the end of a session.
+    if _log_sink: _log_sink.flush()
+
+
 def log_scraping_profile(session_id, flag, category, username, **kwargs):
     log = {'session_id': session_id,
            'task': 'profile',
@@ -28,7 +137,7 @@ def log_scraping_profile(session_id, flag, category, username, **kwargs):
            'flag': flag,
            'timestamp': datetime.now()}
     log.update(kwargs)
-    q_save_log(log)
+    _get_log_sink().put(log)
 
 
 def log_scraping_tweets(session_id, flag, category, username, begin_date, end_date, **kwargs):
@@ -41,13 +150,21 @@ def log_scraping_tweets(session_id, flag, category, username, begin_date, end_da
            'flag': flag,
            'timestamp': datetime.now()}
     log.update(kwargs)
-    q_save_log(log)
+    _get_log_sink().put(log)
 
 
 def get_dead_tweets_periods(session_id=-1):
-    session_id = q_get_max_sesion_id() if session_id == -1 else session_id
+    # Returns a df with username, session_begin_date and session_end_date. The 'session' dates are the dates of the dead periods.
+    session_id = get_max_sesion_id() if session_id == -1 else session_id
     print(session_id)
-    failed_periods_logs = q_get_dead_tweets_periods_logs(session_id)
+    dead_tasks = q_get_journal_tasks(session_id, 'dead')
+    if dead_tasks:
+        deads_df = pd.DataFrame(dead_tasks)[['username', 'period_begin_date', 'period_end_date']]
+        deads_df.columns = ['username', 'session_begin_date', 'session_end_date']
+        deads_df['session_begin_date'] = deads_df['session_begin_date'].dt.date
+        deads_df['session_end_date'] = deads_df['session_end_date'].dt.date
+        return deads_df
+    failed_periods_logs = q_get_dead_tweets_periods_logs(session_id)  # Sessions from before the journal
     if failed_periods_logs:
         deads_df = pd.DataFrame(failed_periods_logs)
         deads_df['session_begin_date'] = deads_df['session_begin_date'].dt.date
@@ -58,7 +175,106 @@ def get_dead_tweets_periods(session_id=-1):
 
 
 def get_max_sesion_id():
-    return q_get_max_sesion_id()
+    # The last given session_id. The logs are only searched when the sessions counter doesn't exist yet.
+    session_id = q_get_last_session_id()
+    return q_get_max_sesion_id() if session_id is None else session_id
+
+
+def get_new_session_id():
+    session_id = q_get_new_session_id()
+    if session_id is None:  # The first session with a counter continues after the sessions in the logs
+        session_id = q_seed_new_session_id(q_get_max_sesion_id())
+    return session_id
+
+
+def get_last_ended_session_id():
+    # Session ids are given to sessions that run at the same time, so the id before a session isn't necessarily the session before it.
+    # Sessions from before the sessions collection are only in the logs.
+    session_id = q_get_last_ended_session_id()
+    return q_get_max_sesion_id() if session_id is None else session_id
+
+
+def get_session(session_id):
+    return q_get_session(session_id)
+
+
+def get_session_config(session_id):
+    # The config the session was started with, or None. start_session stored its dates (the keys ending with '_date') as datetimes.
+    session = q_get_session(session_id)
+    if not session or not session.get('config'):
+        return None
+    return {key: value.date() if key.endswith('_date') and isinstance(value, datetime) else value for key, value in session['config'].items()}
+
+
+def start_session(session_id, config):
+    # Dates aren't supported by bson, datetimes are
+    config = {key: datetime.combine(value, datetime.min.time()) if isinstance(value, date) and not isinstance(value, datetime) else value
+              for key, value in config.items()}
+    q_start_session(session_id, config)
+
+
+def end_session(session_id, status, totals):
+    # status = 'ok', 'interrupted' or 'failed'
+    q_end_session(session_id, status, totals)
+
+
+def save_session_plan(session_id, plan):
+    # plan = [(username, session_begin_date, session_end_date), ...]
+    q_save_session_plan(session_id, [{'username': username,
+                                      'begin_date': datetime.combine(begin_date, datetime.min.time()),
+                                      'end_date': datetime.combine(end_date, datetime.min.time())} for username, begin_date, end_date in plan])
+
+
+def session_user_planned(session_id, username):
+    # The periods of the user are in the journal
+    q_add_planned_usernames(session_id, [username])
+
+
+def get_unplanned_session_users(session_id):
+    # The (username, session_begin_date, session_end_date)'s of the session's plan whose periods weren't planned yet
+    session = q_get_session(session_id)
+    if not session: return []
+    planned_usernames = set(session.get('planned_usernames', []))
+    return [(d['username'], d['begin_date'].date(), d['end_date'].date()) for d in session.get('plan', []) if d['username'] not in planned_usernames]
+
+
+def journal_tweets_tasks(session_id, tasks):
+    # tasks = [(username, period_begin_date, period_end_date), ...]
+    if not tasks: return
+    journal = [{'session_id': session_id,
+                'username': username,
+                'period_begin_date': datetime.combine(period_begin_date, datetime.min.time()),
+                'period_end_date': datetime.combine(period_end_date, datetime.min.time()),
+                'status': 'planned',
+                'timestamp': datetime.now()} for username, period_begin_date, period_end_date in tasks]
+    q_save_journal_tasks(journal)
+
+
+def journal_tweets_task_done(session_id, username, period_begin_date, period_end_date, status):
+    # status = 'ok' or 'dead'
+    q_update_journal_task(session_id, username,
+                          datetime.combine(period_begin_date, datetime.min.time()),
+                          datetime.combine(period_end_date, datetime.min.time()),
+                          status)
+
+
+def journal_tweets_tasks_done(session_id, tasks, status):
+    # tasks = [(username, period_begin_date, period_end_date), ...]. status = 'ok' or 'dead'
+    q_update_journal_tasks(session_id, [(username,
+                                         datetime.combine(period_begin_date, datetime.min.time()),
+                                         datetime.combine(period_end_date, datetime.min.time())) for username, period_begin_date, period_end_date in tasks],
+                           status)
+
+
+def get_unfinished_tweets_tasks(session_id):
+    tasks = q_get_journal_tasks(session_id, 'planned')
+    if tasks:
+        tasks_df = pd.DataFrame(tasks)[['username', 'period_begin_date', 'period_end_date']]
+        tasks_df['period_begin_date'] = tasks_df['period_begin_date'].dt.date
+        tasks_df['period_end_date'] = tasks_df['period_end_date'].dt.date
+        return tasks_df
+    else:
+        return pd.DataFrame()
 
 
 if __name__ == '__main__':
@@ -25,27 +25,31 @@ Convention:
 IMPLEMENTED QUERIES
 -------------------
 - q_save_log(log)
--
+- q_save_logs(logs)
+- q_get_max_sesion_id()
+- q_get_dead_tweets_periods_logs(session_id)
+- q_get_ok_tweets_periods_logs(username)
 """
 
-from pymongo import MongoClient
 
 from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
 
 database = DATABASE
 collection_name = 'logs'
 
 
-def get_collection():  # Todo: same function in many modules. Put in tools?
-    client = MongoClient()
+def get_collection():
+    client = get_client()
     db = client[database]
     collection = db[collection_name]
     return collection
 
 
 def setup_collection():
-    collection = get_collection()
-    # collection.create_index([('ip', DESCENDING), ('port', DESCENDING)], unique=True)
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
 
 
 def q_save_log(log):
@@ -53,9 +57,14 @@ def q_save_log(log):
     collection.insert_one(log)
 
 
+def q_save_logs(logs):
+    collection = get_collection()
+    collection.insert_many(logs, ordered=False)
+
+
 def q_get_max_sesion_id():
     collection = get_collection()
-    cursor = collection.find({}, {'_id': 0, 'session_id': 1}).sort([('session_id', -1), ('username', 1)]).limit(1)
+    cursor = collection.find({}, {'_id': 0, 'session_id': 1}).sort([('session_id', -1)]).limit(1)
     doc = list(cursor)
     if doc:
         max_session_id = doc[0]['session_id']
@@ -78,5 +87,19 @@ def q_get_dead_tweets_periods_logs(session_id):
     return list(cursor)
 
 
+def q_get_ok_tweets_periods_logs(username):
+    # The periods of 'username' that were scraped successfully, in all sessions
+    collection = get_collection()
+    f = {'username': username,
+         'task': 'tweets',
+         'category': 'period',
+         'flag': 'ok'}
+    p = {'_id': 0,
+         'session_begin_date': 1,
+         'session_end_date': 1}
+    cursor = collection.find(f, p)
+    return list(cursor)
+
+
 if __name__ == '__main__':
     pass
@@ -6,10 +6,11 @@
 import sys
 from datetime import datetime
 
-from pymongo import MongoClient
 from pymongo.errors import DuplicateKeyError
 
 from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
 from tools.logger import logger
 
 """
@@ -33,8 +34,11 @@ IMPLEMENTED QUERIES
 -------------------
 - q_get_a_profile(username)
 - q_get_profiles()
+- q_get_existing_usernames(usernames)
 - q_save_a_profile(username)
 - q_set_profile_scrape_flag(username, flag)
+- q_update_high_water_mark(username, hwm_datetime, hwm_tweet_id)
+- q_get_usernames_without_high_water_mark()
 
 """
 database = DATABASE
@@ -42,14 +46,15 @@ collection_name = 'profiles'
 
 
 def get_collection():
-    client = MongoClient()
+    client = get_client()
     db = client[database]
     collection = db[collection_name]
     return collection
 
 
-def setup_collection():  # Todo: add indexes
-    pass
+def setup_collection():
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
 
 
 def q_get_a_profile(username):
@@ -59,12 +64,23 @@ def q_get_a_profile(username):
     return doc
 
 
-def q_get_profiles():
+def q_get_profiles(p=None):
     collection = get_collection()
-    cursor = collection.find().sort([('username', 1)])
+    cursor = collection.find({}, p).sort([('username', 1)])
     return list(cursor)
 
 
+def q_get_existing_usernames(usernames, chunk_size=1000):
+    # One query per 'chunk_size' usernames, iso one per username
+    collection = get_collection()
+    p = {'_id': 0, 'username': 1}
+    existing = []
+    for i in range(0, len(usernames), chunk_size):
+        q = {'username': {'$in': usernames[i:i + chunk_size]}}
+        existing += [doc['username'] for doc in collection.find(q, p)]
+    return existing
+
+
 def q_save_a_profile(profile):
     collection = get_collection()
     try:
@@ -97,5 +113,23 @@ def q_save_a_profile(profile):
         raise
 
 
+def q_update_high_water_mark(username, hwm_datetime, hwm_tweet_id):
+    # Only moves forward: the mark isn't updated when the stored one is newer
+    collection = get_collection()
+    f = {'username': username,
+         '$or': [{'hwm_datetime': {'$lt': hwm_datetime}},
+                 {'hwm_datetime': {'$exists': False}}]}
+    u = {'$set': {'hwm_datetime': hwm_datetime,
+                  'hwm_tweet_id': hwm_tweet_id}}
+    collection.update_one(f, u)
+
+
+def q_get_usernames_without_high_water_mark():
+    collection = get_collection()
+    q = {'hwm_datetime': {'$exists': False}}
+    p = {'_id': 0, 'username': 1}
+    return [doc['username'] for doc in collection.find(q, p)]
+
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -3,11 +3,19 @@
 # src - proxy_facade.py
 # md
 # --------------------------------------------------------------------------------------------------------
+import atexit
+import sys
+import threading
+import time
+from datetime import datetime
 
 import pandas as pd
+from pymongo.errors import BulkWriteError
 
-from scraper.database.proxy_queries import q_save_a_proxy, q_get_proxies, q_update_a_proxy_test, \
-    q_reset_proxy_stats, q_update_proxy_stats, q_update_proxy_ratio  # , q_update_proxy_stats, q_reset_proxy_stats
+from config import PROXY_STATS_FLUSH_INTERVAL
+from scraper.database.proxy_queries import q_save_proxies, q_get_proxies, q_update_a_proxy_test, q_update_proxies_tests, \
+    q_update_proxies_test, q_reset_proxies_stats, q_update_proxies_stats, q_update_proxies_ratio
+from tools.logger import logger
 from tools.utils import set_pandas_display_options
 
 set_pandas_display_options()
@@ -18,16 +26,96 @@ Functions accept and return dataframes when suitable
 
 IMPLEMENTED FUNCTIONS
 ---------------------
-- get_proxies(blacklisted=None, max_delay=None)
+- get_proxies(max_delay=None, max_ratio=None, blacklisted=False)
 - save_a_proxy_test(proxy, delay)
-- save_proxies(tweets_df)
+- save_proxy_tests(proxy_tests)
+- save_proxies(proxies_df)
 - set_a_proxy_scrape_success_flag(proxy, flag)
 - set_proxies(delay, blacklisted, error_code)
+- update_proxy_stats(flag, proxy)
+- flush_proxy_stats()
+- reset_proxies_stats(totals)
+- update_proxies_ratio()
 """
 
 
-def get_proxies(max_delay=None, max_ratio=None):
-    f = {'blacklisted': False, '$and': []}
+class _ProxyStatsAggregator(threading.Thread):
+    """
+    Counts the proxy usage stats (scrape_n_used, scrape_n_failed, their totals, flag_stats.*, last_flag) in memory
+    and merges them into the proxies collection with one bulk_write every 'flush_interval' seconds.
+    So the stats in the database are at most 'flush_interval' seconds old. The functions that read the stats flush first.
+    Stats that couldn't be written are merged back into the counters and written at the next flush.
+    """
+
+    def __init__(self, flush_interval=PROXY_STATS_FLUSH_INTERVAL):
+        super(_ProxyStatsAggregator, self).__init__(name='ProxyStatsAggregator', daemon=True)
+        self.flush_interval = flush_interval
+        self._stats = {}  # (ip, port): {'ip': ip, 'port': port, 'inc': {...}, 'last_flag': flag, 'timestamp': timestamp}
+        self._stats_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def add(self, flag, proxy):
+        counters = ['scrape_n_used', 'scrape_n_used_total', f'flag_stats.{flag}']
+        if flag != 'ok': counters += ['scrape_n_failed', 'scrape_n_failed_total']
+        with self._stats_lock:
+            stats = self._stats.setdefault((proxy['ip'], proxy['port']), {'ip': proxy['ip'], 'port': proxy['port'], 'inc': {}})
+            for counter in counters:
+                stats['inc'][counter] = stats['inc'].get(counter, 0) + 1
+            stats['last_flag'], stats['timestamp'] = flag, datetime.now()
+
+    def flush(self):
+        with self._write_lock:
+            with self._stats_lock:
+                stats, self._stats = self._stats, {}
+            if not stats: return
+            stats = list(stats.values())
+            try:
+                q_update_proxies_stats(stats)
+            except BulkWriteError as e:  # The stats of the other proxies are written, only the failed ones are retried
+                failed_stats = [stats[error['index']] for error in e.details['writeErrors']]
+                logger.error(f'Writing the stats of {len(failed_stats)} of {len(stats)} proxies failed, retrying at the next flush: {e}')
+                self._restore(failed_stats)
+            except:
+                logger.error(f'Writing the stats of {len(stats)} proxies failed, retrying at the next flush: {sys.exc_info()[1]}')
+                self._restore(stats)
+
+    def _restore(self, stats):
+        # The counts added since the flush are newer, they keep their last_flag and timestamp
+        with self._stats_lock:
+            for old_stats in stats:
+                new_stats = self._stats.setdefault((old_stats['ip'], old_stats['port']), dict(old_stats, inc={}))
+                for counter, n in old_stats['inc'].items():
+                    new_stats['inc'][counter] = new_stats['inc'].get(counter, 0) + n
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_proxy_stats = None
+_proxy_stats_lock = threading.Lock()
+
+
+def _get_proxy_stats():
+    global _proxy_stats
+    with _proxy_stats_lock:
+        if _proxy_stats is None:
+            _proxy_stats = _ProxyStatsAggregator()
+            _proxy_stats.start()
+            atexit.register(_proxy_stats.flush)
+    return _proxy_stats
+
+
+def flush_proxy_stats():
+    if _proxy_stats: _proxy_stats.flush()
+
+
+def get_proxies(max_delay=None, max_ratio=None, blacklisted=False):
+    # blacklisted=None: blacklisted or not
+    flush_proxy_stats()
+    f = {'blacklisted': blacklisted, '$and': []}
+    if blacklisted is None: f.pop('blacklisted')
     if max_delay: f['$and'] = f['$and'] + [{'delay': {'$gt': 0}},
                                            {'delay': {'$lte': max_delay}}]
     if max_ratio: f['$and'] = f['$and'] + [{'fail_ratio': {'$lte': max_ratio}}]
@@ -42,28 +130,36 @@ def save_a_proxy_test(proxy_test):
     q_update_a_proxy_test(proxy_test)
 
 
+def save_proxy_tests(proxy_tests):
+    # proxy_tests = [{'ip': ip, 'port': port, 'delay': delay, 'connect_delay': delay, 'blacklisted': blacklisted, 'error_code': code, 'timestamp': timestamp}, ...]
+    # Returns {'n_matched': n, 'n_modified': n, 'n_upserted': n}
+    return q_update_proxies_tests(proxy_tests)
+
+
 def save_proxies(proxies_df):
-    for _, row in proxies_df.iterrows():
-        proxy = row.to_dict()
-        q_save_a_proxy(proxy)
+    # Returns {'n_inserted': n, 'n_duplicates': n}
+    if proxies_df.empty: return {'n_inserted': 0, 'n_duplicates': 0}
+    proxies_df = proxies_df.drop_duplicates(subset=['ip', 'port'])
+    result = q_save_proxies(proxies_df.to_dict('records'))
+    logger.info(f'Saved proxies | new={result["n_inserted"]}, duplicates={result["n_duplicates"]}')
+    return result
 
 
-def set_proxies(delay=999999, blacklisted=False, error_code=-1):  # Todo: Name is not clear and use update_many in the query iso loop
-    for proxy in q_get_proxies({}):
-        proxy_test = proxy
-        proxy_test['delay'] = delay
-        proxy_test['blacklisted'] = blacklisted
-        proxy_test['error_code'] = error_code
-        q_update_a_proxy_test(proxy_test)
+def set_proxies(delay=999999, blacklisted=False, error_code=-1):  # Todo: Name is not clear
+    # Sets the test result of all proxies. Returns {'n_matched': n, 'n_modified': n}
+    return q_update_proxies_test(delay=delay, blacklisted=blacklisted, error_code=error_code)
 
 
 def update_proxy_stats(flag, proxy):
-    q_update_proxy_stats(flag, proxy)
+    _get_proxy_stats().add(flag, proxy)
 
 
-def reset_proxies_stats(totals=False):  # todo: Refactor: Use update_multi iso looping
-    for proxy in q_get_proxies({}):
-        q_reset_proxy_stats(proxy, totals=totals)
+def reset_proxies_stats(totals=False):
+    # Returns {'n_matched': n, 'n_modified': n}
+    flush_proxy_stats()
+    result = q_reset_proxies_stats(totals=totals)
+    logger.info(f'Reset proxies stats | totals={totals}, proxies={result["n_matched"]}')
+    return result
 
 
 def update_proxies_ratio():
@@ -71,13 +167,8 @@ def update_proxies_ratio():
     Formula to calculate the ratio's:
     - if scrape_n_used_total < 5 => ratio = 0 # favour new ones
     """
-    proxies = q_get_proxies({})
-    for proxy in proxies:
-        if proxy['scrape_n_used_total'] < 20:
-            proxy['ratio'] = 0
-        else:
-            proxy['ratio'] = proxy['scrape_n_failed_total'] / proxy['scrape_n_used_total']
-        q_update_proxy_ratio(proxy)
+    flush_proxy_stats()
+    q_update_proxies_ratio(min_n_used=20)
 
 
 if __name__ == '__main__':
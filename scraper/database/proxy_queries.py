@@ -5,10 +5,12 @@
 # --------------------------------------------------------------------------------------------------------
 from datetime import datetime
 
-from pymongo import MongoClient, DESCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
 from tools.logger import logger
 
 """
@@ -31,26 +33,30 @@ Convention:
 IMPLEMENTED QUERIES
 -------------------
 - q_get_proxies(q)
-- q_save_a_proxy(proxy)
+- q_save_proxies(proxies)
 - q_update_a_proxy_test(proxy_test)
-- q_reset_proxy_stats(proxy)
+- q_update_proxies_tests(proxy_tests)
+- q_update_proxies_test(delay, blacklisted, error_code)
+- q_reset_proxies_stats(totals)
 - q_update_proxy_stats(proxy, flag)
+- q_update_proxies_stats(proxies_stats)
+- q_update_proxies_ratio(min_n_used)
 """
 
 database = DATABASE
 collection_name = 'proxies'
 
 
-def get_collection():  # Todo: same function in many modules. Put in tools?
-    client = MongoClient()
+def get_collection():
+    client = get_client()
     db = client[database]
     collection = db[collection_name]
     return collection
 
 
 def setup_collection():
-    collection = get_collection()
-    collection.create_index([('ip', DESCENDING), ('port', DESCENDING)], unique=True)
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
 
 
 def q_get_proxies(f):
@@ -63,24 +69,31 @@ def q_get_proxies(f):
     return proxies
 
 
-def q_save_a_proxy(proxy):
+def q_save_proxies(proxies):
+    # Unordered, so the duplicates (unique index on ip, port) are skipped and the rest is inserted
     collection = get_collection()
-    d = proxy
     # New proxies have not been tested
-    d['delay'] = 999999
-    d['blacklisted'] = True
-    d['error_code'] = 0
-    d['test_n_blacklisted'] = 0
-    d['test_n_tested'] = 0
-    d['scrape_success'] = True
-    d['scrape_n_used'] = 0
-    d['scrape_n_failed'] = 0
-    d['scrape_n_used_total'] = 0
-    d['scrape_n_failed_total'] = 0
+    new = {'delay': 999999,
+           'blacklisted': True,
+           'error_code': 0,
+           'test_n_blacklisted': 0,
+           'test_n_tested': 0,
+           'scrape_success': True,
+           'scrape_n_used': 0,
+           'scrape_n_failed': 0,
+           'scrape_n_used_total': 0,
+           'scrape_n_failed_total': 0}
+    documents = [{**proxy, **new} for proxy in proxies]
+    if not documents: return {'n_inserted': 0, 'n_duplicates': 0}
     try:
-        collection.insert_one(d)
-    except DuplicateKeyError as e:
-        logger.warning(f"Duplicate proxy: {proxy['ip']}:{proxy['port']}")
+        result = collection.insert_many(documents, ordered=False)
+        return {'n_inserted': len(result.inserted_ids), 'n_duplicates': 0}
+    except BulkWriteError as e:
+        errors = e.details['writeErrors']
+        n_duplicates = sum(1 for error in errors if error['code'] == 11000)
+        if n_duplicates < len(errors):
+            logger.error(f'Saving proxies failed: {[error["errmsg"] for error in errors if error["code"] != 11000][:5]}')
+        return {'n_inserted': e.details['nInserted'], 'n_duplicates': n_duplicates}
 
 
 def q_update_a_proxy_test(proxy_test):
@@ -95,6 +108,37 @@ def q_update_a_proxy_test(proxy_test):
     collection.update_one(f, u, upsert=True)
 
 
+def q_update_proxies_tests(proxy_tests):
+    # Like q_update_a_proxy_test, for many proxies in one unordered bulk_write. Returns {'n_matched': n, 'n_modified': n, 'n_upserted': n}
+    collection = get_collection()
+    requests = [UpdateOne({'ip': proxy_test['ip'],
+                           'port': proxy_test['port']},
+                          {'$set': {'delay': proxy_test['delay'],
+                                    'connect_delay': proxy_test['connect_delay'],
+                                    'blacklisted': proxy_test['blacklisted'],
+                                    'error_code': proxy_test['error_code'],
+                                    'test_timestamp': proxy_test['timestamp']},
+                           '$inc': {'test_n_blacklisted': int(proxy_test['blacklisted']),
+                                    'test_n_tested': 1}},
+                          upsert=True)
+                for proxy_test in proxy_tests]
+    if not requests: return {'n_matched': 0, 'n_modified': 0, 'n_upserted': 0}
+    result = collection.bulk_write(requests, ordered=False)
+    return {'n_matched': result.matched_count, 'n_modified': result.modified_count, 'n_upserted': result.upserted_count}
+
+
+def q_update_proxies_test(delay=999999, blacklisted=False, error_code=-1):
+    # Sets the test result of all proxies at once, counted as a test like q_update_a_proxy_test
+    collection = get_collection()
+    u = {'$set': {'delay': delay,
+                  'blacklisted': blacklisted,
+                  'error_code': error_code},
+         '$inc': {'test_n_blacklisted': int(blacklisted),
+                  'test_n_tested': 1}}
+    result = collection.update_many({}, u)
+    return {'n_matched': result.matched_count, 'n_modified': result.modified_count}
+
+
 def q_update_proxy_stats(flag, proxy):
     collection = get_collection()
     f = {'ip': proxy['ip'], 'port': proxy['port']}
@@ -113,9 +157,20 @@ def q_update_proxy_stats(flag, proxy):
     collection.update_one(f, u, upsert=True)
 
 
-def q_reset_proxy_stats(proxy, totals=False):
+def q_update_proxies_stats(proxies_stats):
+    # proxies_stats = [{'ip': ip, 'port': port, 'inc': {counter: n, ...}, 'last_flag': flag, 'timestamp': timestamp}, ...]
+    collection = get_collection()
+    requests = [UpdateOne({'ip': stats['ip'], 'port': stats['port']},
+                          {'$set': {'last_flag': stats['last_flag'],
+                                    'timestamp': stats['timestamp']},
+                           '$inc': stats['inc']},
+                          upsert=True)
+                for stats in proxies_stats]
+    if requests: collection.bulk_write(requests, ordered=False)
+
+
+def q_reset_proxies_stats(totals=False):
     collection = get_collection()
-    f = {'ip': proxy['ip'], 'port': proxy['port']}
     u = {'$set': {'last_flag': '',
                   'scrape_n_used': 0,
                   'scrape_n_failed': 0,
@@ -124,15 +179,20 @@ def q_reset_proxy_stats(proxy, totals=False):
                                  'scrape_n_failed_total': 0,
                                  'flag_stats': {},
                                  'fail_ratio': 0})
-
-    collection.update_one(f, u, upsert=True)
+    result = collection.update_many({}, u)
+    return {'n_matched': result.matched_count, 'n_modified': result.modified_count}
 
 
-def q_update_proxy_ratio(proxy):
+def q_update_proxies_ratio(min_n_used=20):
+    # Calculated by the server for all proxies in one update with an aggregation pipeline (MongoDB >= 4.2)
     collection = get_collection()
-    f = {'ip': proxy['ip'], 'port': proxy['port']}
-    u = {'$set': {'fail_ratio': proxy['ratio']}}
-    collection.update_one(f, u)
+    n_used = {'$ifNull': ['$scrape_n_used_total', 0]}
+    n_failed = {'$ifNull': ['$scrape_n_failed_total', 0]}
+    pl = [{'$set': {'fail_ratio': {'$cond': [{'$lt': [n_used, min_n_used]},
+                                             0,
+                                             {'$divide': [n_failed, n_used]}]}}}]
+    result = collection.update_many({}, pl)
+    return result.modified_count
 
 
 def q_temp():
@@ -0,0 +1,146 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - session_queries.py
+# md
+# --------------------------------------------------------------------------------------------------------
+from datetime import datetime
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
+
+"""
+Group of queries to store and retrief the scraping sessions.
+Every session has one document with _id = session_id, its config, start and end times and summary totals.
+The document with _id = 'counter' holds the last given session_id. It's incremented atomically, so two sessions never get the same id.
+The queries start with 'q_'
+Queries accept and return a dict or a lists of dicts when suitable
+
+Convention:
+-----------
+- documnet:     d
+- query:        q
+- projection:   p
+- sort:         s
+- filter:       f
+- update:       u
+- pipeline      pl
+- match         m
+- group:        g
+
+IMPLEMENTED QUERIES
+-------------------
+- q_get_new_session_id()
+- q_seed_new_session_id(min_session_id)
+- q_get_last_session_id()
+- q_get_session(session_id)
+- q_get_last_ended_session_id()
+- q_start_session(session_id, config)
+- q_end_session(session_id, status, totals)
+- q_save_session_plan(session_id, plan)
+- q_add_planned_usernames(session_id, usernames)
+"""
+
+database = DATABASE
+collection_name = 'sessions'
+counter_id = 'counter'
+
+
+def get_collection():
+    client = get_client()
+    db = client[database]
+    collection = db[collection_name]
+    return collection
+
+
+def setup_collection():
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
+
+
+def q_get_new_session_id():
+    # Returns None when there's no counter yet
+    collection = get_collection()
+    f = {'_id': counter_id}
+    u = {'$inc': {'last_session_id': 1}}
+    d = collection.find_one_and_update(f, u, return_document=ReturnDocument.AFTER)
+    return d['last_session_id'] if d else None
+
+
+def q_seed_new_session_id(min_session_id):
+    # Creates the counter at 'min_session_id' (or keeps it when it's higher) and returns the next session_id
+    collection = get_collection()
+    f = {'_id': counter_id}
+    pl = [{'$set': {'last_session_id': {'$add': [{'$max': ['$last_session_id', min_session_id]}, 1]}}}]
+    try:
+        d = collection.find_one_and_update(f, pl, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:  # An other session created the counter first
+        return q_get_new_session_id()
+    return d['last_session_id']
+
+
+def q_get_last_session_id():
+    # Returns None when there's no counter yet
+    collection = get_collection()
+    d = collection.find_one({'_id': counter_id})
+    return d['last_session_id'] if d else None
+
+
+def q_get_session(session_id):
+    collection = get_collection()
+    d = collection.find_one({'_id': session_id})
+    return d
+
+
+def q_get_last_ended_session_id():
+    # The session that ended last. Rescraping sessions (negative ids) and the counter aren't sessions that can be rescraped. Returns None when there's none.
+    collection = get_collection()
+    f = {'_id': {'$gt': 0},
+         'ended_at': {'$ne': None}}
+    cursor = collection.find(f, {'_id': 1}).sort([('ended_at', -1)]).limit(1)
+    doc = list(cursor)
+    return doc[0]['_id'] if doc else None
+
+
+def q_start_session(session_id, config):
+    # A resumed session keeps its document. Its start time is replaced and its nr of runs incremented.
+    collection = get_collection()
+    f = {'_id': session_id}
+    u = {'$set': {'config': config,
+                  'status': 'running',
+                  'started_at': datetime.now(),
+                  'ended_at': None},
+         '$inc': {'n_runs': 1}}
+    collection.update_one(f, u, upsert=True)
+
+
+def q_end_session(session_id, status, totals):
+    collection = get_collection()
+    f = {'_id': session_id}
+    u = {'$set': {'status': status,
+                  'ended_at': datetime.now(),
+                  'totals': totals}}
+    collection.update_one(f, u, upsert=True)
+
+
+def q_save_session_plan(session_id, plan):
+    # plan = [{'username': username, 'begin_date': datetime, 'end_date': datetime}, ...], the users the session plans the periods of
+    collection = get_collection()
+    f = {'_id': session_id}
+    u = {'$set': {'plan': plan,
+                  'planned_usernames': []}}
+    collection.update_one(f, u, upsert=True)
+
+
+def q_add_planned_usernames(session_id, usernames):
+    collection = get_collection()
+    f = {'_id': session_id}
+    u = {'$addToSet': {'planned_usernames': {'$each': usernames}}}
+    collection.update_one(f, u, upsert=True)
+
+
+if __name__ == '__main__':
+    pass
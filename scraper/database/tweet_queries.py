@@ -6,10 +6,12 @@
 import sys
 from datetime import datetime
 
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 
 from config import DATABASE
+from scraper.database.db_client import get_client
+from scraper.database.indexes import setup_indexes
 from tools.logger import logger
 
 """
@@ -32,8 +34,12 @@ Convention:
 IMPLEMENTED QUERIES
 -------------------
 - q_get_nr_tweets_per_day(username, session_begin_date, session_end_date)
+- q_get_nr_tweets_per_user(begin_date)
+- q_get_newest_tweets(usernames, chunk_size)
 - q_save_a_tweet(tweet)
 - q_update_a_tweet(tweet)
+- q_save_tweets(tweets, chunk_size)
+- q_update_tweets(tweets, chunk_size)
 """
 
 database = DATABASE
@@ -41,15 +47,15 @@ collection_name = 'tweets'
 
 
 def get_collection():
-    client = MongoClient()
+    client = get_client()
     db = client[database]
     collection = db[collection_name]
     return collection
 
 
-def setup_collection():  # Todo: add indexes
-    collection = get_collection()
-    collection.create_index('tweet_id', unique=True)
+def setup_collection():
+    # The indexes are declared in scraper/database/indexes.py
+    setup_indexes([collection_name])
 
 
 def q_get_nr_tweets_per_day(username, begin_date=datetime(2000, 1, 1), end_date=datetime(2035, 1, 1)):
@@ -68,6 +74,33 @@ def q_get_nr_tweets_per_day(username, begin_date=datetime(2000, 1, 1), end_date=
     return list(cursor)
 
 
+def q_get_nr_tweets_per_user(begin_date):
+    collection = get_collection()
+    m = {'$match': {'datetime': {'$gte': begin_date}}}
+    g = {'$group': {'_id': '$username',
+                    'nr_tweets': {'$sum': 1}}}
+    p = {'$project': {'username': '$_id',
+                      'nr_tweets': 1, '_id': 0}}
+    cursor = collection.aggregate([m, g, p])
+    return list(cursor)
+
+
+def q_get_newest_tweets(usernames, chunk_size=1000):
+    # The newest tweet of every user in 'usernames' that has tweets. The $sort + $group $first uses the username, datetime index.
+    collection = get_collection()
+    newest_tweets = []
+    for i in range(0, len(usernames), chunk_size):
+        m = {'$match': {'username': {'$in': usernames[i:i + chunk_size]}}}
+        s = {'$sort': {'username': ASCENDING, 'datetime': DESCENDING}}
+        g = {'$group': {'_id': '$username',
+                        'datetime': {'$first': '$datetime'},
+                        'tweet_id': {'$first': '$tweet_id'}}}
+        p = {'$project': {'username': '$_id',
+                          'datetime': 1, 'tweet_id': 1, '_id': 0}}
+        newest_tweets.extend(collection.aggregate([m, s, g, p]))
+    return newest_tweets
+
+
 def q_save_a_tweet(tweet):
     collection = get_collection()
     try:
@@ -91,6 +124,48 @@ def q_update_a_tweet(tweet):  # Todo: replace tweet with its fields
         logger.error(f"Duplicate: {tweet['tweet_id']} - {tweet['date']} - {tweet['name']}")
 
 
+def q_save_tweets(tweets, chunk_size=1000):
+    # Inserts the tweets with unordered insert_many's of 'chunk_size' tweets. Tweets that already exist are skipped.
+    collection = get_collection()
+    result = {'inserted': 0, 'duplicates': 0, 'errors': 0}
+    for i in range(0, len(tweets), chunk_size):
+        chunk = tweets[i:i + chunk_size]
+        try:
+            result['inserted'] += len(collection.insert_many(chunk, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            write_errors = e.details['writeErrors']
+            n_duplicates = sum(1 for error in write_errors if error['code'] == 11000)
+            result['inserted'] += e.details['nInserted']
+            result['duplicates'] += n_duplicates
+            result['errors'] += len(write_errors) - n_duplicates
+            logger.debug(f'Chunk {i // chunk_size}: {n_duplicates} duplicates')
+            if len(write_errors) > n_duplicates:
+                logger.error(f'Chunk {i // chunk_size}: {len(write_errors) - n_duplicates} errors: {[error["errmsg"] for error in write_errors if error["code"] != 11000][:5]}')
+    return result
+
+
+def q_update_tweets(tweets, chunk_size=1000):
+    # Upserts the tweets with unordered bulk_write's of 'chunk_size' tweets
+    collection = get_collection()
+    timestamp = datetime.now()
+    result = {'upserted': 0, 'modified': 0, 'errors': 0}
+    for i in range(0, len(tweets), chunk_size):
+        chunk = tweets[i:i + chunk_size]
+        requests = [UpdateOne({'tweet_id': tweet['tweet_id']}, {'$set': dict(tweet, timestamp=timestamp)}, upsert=True) for tweet in chunk]
+        try:
+            chunk_result = collection.bulk_write(requests, ordered=False)
+            result['upserted'] += chunk_result.upserted_count
+            result['modified'] += chunk_result.modified_count
+        except BulkWriteError as e:
+            write_errors = e.details['writeErrors']
+            result['upserted'] += e.details['nUpserted']
+            result['modified'] += e.details['nModified']
+            result['errors'] += len(write_errors)
+            logger.error(f'Chunk {i // chunk_size}: {len(write_errors)} errors: {[error["errmsg"] for error in write_errors][:5]}')
+    logger.debug(f'Updated {len(tweets)} tweets: {result}')
+    return result
+
+
 
 if __name__ == '__main__':
     pass
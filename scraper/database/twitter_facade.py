@@ -3,12 +3,15 @@
 # src - twitter_facade.py
 # md
 # --------------------------------------------------------------------------------------------------------
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pandas as pd
 
-from scraper.database.profile_queries import q_get_a_profile, q_save_a_profile, q_get_profiles
-from scraper.database.tweet_queries import q_get_nr_tweets_per_day, q_save_a_tweet, q_update_a_tweet
+from scraper.database.coverage_queries import q_get_coverage, q_update_coverage
+from scraper.database.log_queries import q_get_ok_tweets_periods_logs
+from scraper.database.profile_queries import q_get_a_profile, q_save_a_profile, q_get_profiles, q_update_high_water_mark, q_get_existing_usernames
+from scraper.database.profile_queries import q_get_usernames_without_high_water_mark
+from scraper.database.tweet_queries import q_get_nr_tweets_per_day, q_get_nr_tweets_per_user, q_get_newest_tweets, q_save_tweets, q_update_tweets
 from tools.logger import logger
 from tools.utils import set_pandas_display_options
 
@@ -23,7 +26,16 @@ IMPLEMENTED FUNCTIONS
 - get_join_date(username)
 - get_a_profile(username)
 - get_profiles()
+- get_existing_usernames(usernames)
 - get_nr_tweets_per_day(username, session_begin_date, session_end_date)
+- get_avg_tweets_per_day(username)
+- get_high_water_mark(username)
+- backfill_high_water_marks()
+- get_tweets_per_day_rates(n_days)
+- mark_period_scraped(username, begin_date, end_date)
+- mark_periods_scraped(periods)
+- get_periods_not_scraped(username, begin_date, end_date)
+- get_scraped_through_date(username, begin_date)
 - reset_all_scrape_flags()
 - save_a_profile(profiles_df)
 - save_tweets(tweets_df)
@@ -31,78 +43,88 @@ IMPLEMENTED FUNCTIONS
 """
 
 
-def save_tweets(tweets_df, update=True):
+# The fields of a tweet document, in the order they have in Mongodb
+tweet_fields = ['tweet_id',
+                'conversation_id',
+                'user_id',
+                'username',
+                'name',
+                'created_at',
+                'datetime',
+                'date',
+                'time',
+                'timezone',
+                'day',
+                'hour',
+
+                'tweet',
+                'hashtags',
+                'cashtags',
+                'reply_to',
+                'is_reply',
+                'quote_url',
+                'link',
+
+                'retweet',
+                'nlikes',
+                'nreplies',
+                'nretweets',
+
+                'search',
+                'source',
+                'near',
+                'geo',
+                'place',
+
+                'user_rt_id',
+                'user_rt',
+                'retweet_id',
+
+                'retweet_date',
+                'translate',
+                'trans_src',
+                'trans_dest',
+                ]
+
+
+def save_tweets(tweets_df, update=True, chunk_size=1000):
     # Update necessary to have correct likes, replies, etc
-    def _format_tweets_df(df):
-        df = df.rename(columns={'id': 'tweet_id'})
-
-        # Make user_id string
-        df['user_id'] = df['user_id'].apply(str)
-        # Make all usernamers lowercase
-        df['username'] = df['username'].str.lower()
-
-        def f(lst):  # [{'user_id': '11767', 'username': 'xxx'}, ... ]
-            for dct in lst:
-                dct['username'] = dct['username'].lower()
-
-        df['reply_to'].apply(lambda x: f(x))
-        # Add is_reply
-        df['is_reply'] = df['tweet_id'] != df['conversation_id']
-        # Add datetime columns
-        df['datetime'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S')
-        df['date'] = df['datetime'].dt.date.apply(str)
-        df['time'] = df['datetime'].dt.time.apply(str)
-        return df
-
-    def _reorder_tweets_df_columns(df):
-        # Reorder the columns, to have the fields in Mongodb in the right order
-        columns = ['tweet_id',
-                   'conversation_id',
-                   'user_id',
-                   'username',
-                   'name',
-                   'created_at',
-                   'datetime',
-                   'date',
-                   'time',
-                   'timezone',
-                   'day',
-                   'hour',
-
-                   'tweet',
-                   'hashtags',
-                   'cashtags',
-                   'reply_to',
-                   'is_reply',
-                   'quote_url',
-                   'link',
-
-                   'retweet',
-                   'nlikes',
-                   'nreplies',
-                   'nretweets',
-
-                   'search',
-                   'source',
-                   'near',
-                   'geo',
-                   'place',
-
-                   'user_rt_id',
-                   'user_rt',
-                   'retweet_id',
-
-                   'retweet_date',
-                   'translate',
-                   'trans_src',
-                   'trans_dest',
-                   ]
-        return df[columns]
-
-    tweets_df = _format_tweets_df(tweets_df)
-    tweets_df = _reorder_tweets_df_columns(tweets_df)
-    for _, row in tweets_df.iterrows():
-        q_update_a_tweet(row.to_dict()) if update else q_save_a_tweet(row.to_dict())
+    tweets = _format_tweets(tweets_df)
+    result = q_update_tweets(tweets, chunk_size) if update else q_save_tweets(tweets, chunk_size)
+    if not result['errors']:  # A mark past tweets that weren't written would skip them in the next incremental scrape
+        _update_high_water_marks(tweets)
+    return result
+
+
+def _format_tweets(tweets_df):
+    """
+    Converts a twint tweets_df into a list of tweet documents that are ready to be written.
+    Every column is converted at once and the documents are zipped from the column lists, no rows are boxed in a Series.
+    See benchmark_format_tweets.py
+    """
+    datetimes = pd.to_datetime(tweets_df['date'], format='%Y-%m-%d %H:%M:%S')
+    columns = {'tweet_id': tweets_df['id'].tolist(),
+               'user_id': tweets_df['user_id'].astype(str).tolist(),  # Make user_id string
+               'username': tweets_df['username'].str.lower().tolist(),  # Make all usernamers lowercase
+               # [{'user_id': '11767', 'username': 'xxx'}, ... ]
+               'reply_to': [[dict(dct, username=dct['username'].lower()) for dct in lst] for lst in tweets_df['reply_to']],
+               'is_reply': (tweets_df['id'] != tweets_df['conversation_id']).tolist(),
+               'datetime': datetimes.tolist(),
+               'date': datetimes.dt.strftime('%Y-%m-%d').tolist(),
+               'time': datetimes.dt.strftime('%H:%M:%S').tolist()}
+    for field in tweet_fields:
+        if field not in columns: columns[field] = tweets_df[field].tolist()
+    return [dict(zip(tweet_fields, values)) for values in zip(*[columns[field] for field in tweet_fields])]
+
+
+def _update_high_water_marks(tweets):
+    # The newest tweet of every user in tweets
+    newest = {}
+    for tweet in tweets:
+        if tweet['username'] not in newest or tweet['datetime'] > newest[tweet['username']]['datetime']:
+            newest[tweet['username']] = tweet
+    for username, tweet in newest.items():
+        q_update_high_water_mark(username, tweet['datetime'].to_pydatetime(), tweet['tweet_id'])
 
 
 def save_a_profile(profiles_df):
@@ -128,6 +150,11 @@ def get_a_profile(username):
     return doc  # Todo: Should return a list or df
 
 
+def get_existing_usernames(usernames):
+    # Returns the set of usernames that already have a profile in the database
+    return set(q_get_existing_usernames(list(usernames)))
+
+
 def get_usernames():
     profiles_df = get_profiles()  # Todo: refactor: inconsistent nameing for same profiles_df, username_df
     usernames_df = profiles_df[['user_id', 'username']]
@@ -152,6 +179,139 @@ def get_nr_tweets_per_day(username, start_date=datetime(2000, 1, 1), end_date=da
     return pd.DataFrame(nr_tweets_per_day)
 
 
+def get_avg_tweets_per_day(username):
+    # Based on the last scraped 'tweets' counter of the profile. Returns None when the profile or its counter doesn't exist.
+    profile = q_get_a_profile(username)
+    try:
+        n_tweets = profile['tweets'][-1]
+        join_date = datetime.strptime(profile['join_date'], '%Y-%m-%d')
+    except (TypeError, KeyError, IndexError):
+        return None
+    n_days = max((datetime.now() - join_date).days, 1)
+    return n_tweets / n_days
+
+
+def get_high_water_mark(username):
+    # Returns (datetime, tweet_id) of the newest tweet of the user in the database, or None
+    profile = q_get_a_profile(username)
+    if not profile or 'hwm_datetime' not in profile:
+        return None
+    return profile['hwm_datetime'], profile['hwm_tweet_id']
+
+
+def backfill_high_water_marks():
+    """
+    Sets the high-water mark of the profiles that don't have one yet from their newest stored tweet, e.g. the tweets saved before the marks existed.
+    Returns the nr of marks set. Once every user with tweets has a mark, only the users without tweets are looked up.
+    """
+    newest_tweets = q_get_newest_tweets(q_get_usernames_without_high_water_mark())
+    for tweet in newest_tweets:
+        q_update_high_water_mark(tweet['username'], tweet['datetime'], tweet['tweet_id'])
+    if newest_tweets: logger.info(f'Backfilled {len(newest_tweets)} high-water marks')
+    return len(newest_tweets)
+
+
+def get_tweets_per_day_rates(n_days=30):
+    """
+    Returns a dict {username: expected nr of tweets per day}.
+    That's the highest of the rate of the tweets stored for the last 'n_days' days and the rate of the profile's 'tweets' counter between its last two scrapes.
+    """
+    rates = {d['username']: d['nr_tweets'] / n_days for d in q_get_nr_tweets_per_user(datetime.now() - timedelta(days=n_days))}
+    for profile in q_get_profiles({'_id': 0, 'username': 1, 'tweets': 1, 'timestamp': 1}):
+        tweets, timestamps = profile.get('tweets', []), profile.get('timestamp', [])
+        if len(tweets) < 2 or len(timestamps) < 2: continue
+        n_days_between = max((timestamps[-1] - timestamps[-2]).total_seconds() / 86400, 1 / 24)
+        rate = max(tweets[-1] - tweets[-2], 0) / n_days_between
+        rates[profile['username']] = max(rates.get(profile['username'], 0), rate)
+    return rates
+
+
+# The coverage bitmap of a user has 1 bit per day since coverage_origin_date. The bit is set when the day was scraped successfully, even without tweets.
+# In the database the bitmap is stored as little endian bytes, here it's a python int.
+# A new bitmap starts with the days that were scraped before it existed. See _get_coverage_before_bitmap().
+coverage_origin_date = datetime(2006, 1, 1).date()
+
+
+def _coverage_day(date):
+    return max((date - coverage_origin_date).days, 0)
+
+
+def _coverage_mask(begin_date, end_date):
+    first_day, last_day = _coverage_day(begin_date), _coverage_day(end_date)
+    return ((1 << (last_day - first_day + 1)) - 1) << first_day
+
+
+def _get_coverage_before_bitmap(username):
+    # The days with stored tweets and the periods logged 'ok', the same history _get_periods_without_min_tweets falls back on
+    bitmap = 0
+    for nr_tweets_per_day in q_get_nr_tweets_per_day(username):
+        if nr_tweets_per_day['date'].date() >= coverage_origin_date:
+            bitmap |= 1 << _coverage_day(nr_tweets_per_day['date'].date())
+    for log in q_get_ok_tweets_periods_logs(username):
+        begin_date, end_date = log['session_begin_date'].date(), log['session_end_date'].date()
+        # These periods were scraped with twint's exclusive Until = end_date, so their last day wasn't, unless it was a 1 day period
+        if end_date > begin_date: end_date -= timedelta(days=1)
+        if end_date >= coverage_origin_date:
+            bitmap |= _coverage_mask(begin_date, end_date)
+    return bitmap
+
+
+def mark_period_scraped(username, begin_date, end_date):
+    mark_periods_scraped([(username, begin_date, end_date)])
+
+
+def mark_periods_scraped(periods):
+    # periods = [(username, begin_date, end_date), ...]. One update per user.
+    masks = {}
+    for username, begin_date, end_date in periods:
+        masks[username] = masks.get(username, 0) | _coverage_mask(begin_date, end_date)
+    for username, mask in masks.items():
+        _mark_days_scraped(username, mask)
+
+
+def _mark_days_scraped(username, mask):
+    while True:  # Retry when an other scrape updated the bitmap in the meantime
+        coverage = q_get_coverage(username)
+        bitmap, version = (int.from_bytes(coverage['bitmap'], 'little'), coverage['version']) if coverage else (_get_coverage_before_bitmap(username), 0)
+        bitmap |= mask
+        if q_update_coverage(username, bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), version):
+            break
+
+
+def get_periods_not_scraped(username, begin_date, end_date):
+    """
+    Returns the list of (begin_date, end_date) periods between begin_date and end_date that weren't scraped successfully yet,
+    or None when the user has no coverage bitmap at all.
+    """
+    coverage = q_get_coverage(username)
+    if not coverage:
+        return None
+    begin_date = max(begin_date, coverage_origin_date)
+    if begin_date > end_date: return []
+    missing = ~int.from_bytes(coverage['bitmap'], 'little') & _coverage_mask(begin_date, end_date)
+    periods = []
+    while missing:
+        start = (missing & -missing).bit_length() - 1  # lowest set bit
+        run = missing >> start
+        length = ((run + 1) & ~run).bit_length() - 1  # nr of set bits from 'start' on
+        periods.append((coverage_origin_date + timedelta(days=start), coverage_origin_date + timedelta(days=start + length - 1)))
+        missing &= ~(((1 << length) - 1) << start)
+    return periods
+
+
+def get_scraped_through_date(username, begin_date):
+    # Returns the last day of the days from begin_date on that were all scraped successfully, or None when begin_date wasn't
+    coverage = q_get_coverage(username)
+    if not coverage or begin_date < coverage_origin_date:
+        return None
+    first_day = _coverage_day(begin_date)
+    covered = int.from_bytes(coverage['bitmap'], 'little') >> first_day
+    if not covered & 1:
+        return None
+    length = ((covered + 1) & ~covered).bit_length() - 1  # nr of set bits from first_day on
+    return begin_date + timedelta(days=length - 1)
+
+
 # def reset_all_scrape_flags():  # Todo: Refactor: use update_many in query!
 #     for profile in q_get_profiles():
 #         q_set_profile_scrape_flag(profile['username'], 0)
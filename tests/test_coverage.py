@@ -0,0 +1,57 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_coverage.py
+# md
+# --------------------------------------------------------------------------------------------------------
+from datetime import date, datetime
+
+import pytest
+
+from scraper.database import twitter_facade
+
+"""
+Runs the coverage bitmap of scraper/database/twitter_facade.py against stubbed queries, so no database is needed.
+"""
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # db['coverage']: the coverage document, db['tweets']: nr of tweets per day, db['logs']: the 'ok' periods logs
+    db = {'coverage': None, 'tweets': [], 'logs': []}
+
+    def q_update_coverage(username, bitmap, version):
+        db['coverage'] = {'bitmap': bitmap, 'version': version + 1}
+        return True
+
+    monkeypatch.setattr(twitter_facade, 'q_get_coverage', lambda username: db['coverage'])
+    monkeypatch.setattr(twitter_facade, 'q_update_coverage', q_update_coverage)
+    monkeypatch.setattr(twitter_facade, 'q_get_nr_tweets_per_day', lambda username: db['tweets'])
+    monkeypatch.setattr(twitter_facade, 'q_get_ok_tweets_periods_logs', lambda username: db['logs'])
+    return db
+
+
+def test_no_bitmap(db):
+    assert twitter_facade.get_periods_not_scraped('x', date(2020, 1, 1), date(2020, 1, 31)) is None
+
+
+def test_new_bitmap_keeps_the_history(db):
+    db['tweets'] = [{'date': datetime(2020, 1, 3), 'nr_tweets': 2}]
+    db['logs'] = [{'session_begin_date': datetime(2020, 1, 10), 'session_end_date': datetime(2020, 1, 12)}]
+    twitter_facade.mark_period_scraped('x', date(2020, 1, 20), date(2020, 1, 31))
+    assert twitter_facade.get_periods_not_scraped('x', date(2020, 1, 1), date(2020, 1, 31)) == [
+        (date(2020, 1, 1), date(2020, 1, 2)), (date(2020, 1, 4), date(2020, 1, 9)), (date(2020, 1, 12), date(2020, 1, 19))]  # 12: Until was exclusive
+
+
+def test_existing_bitmap_isnt_refilled(db):
+    twitter_facade.mark_period_scraped('x', date(2020, 1, 1), date(2020, 1, 2))
+    db['tweets'] = [{'date': datetime(2020, 1, 3), 'nr_tweets': 2}]
+    twitter_facade.mark_period_scraped('x', date(2020, 1, 5), date(2020, 1, 5))
+    assert twitter_facade.get_periods_not_scraped('x', date(2020, 1, 1), date(2020, 1, 5)) == [(date(2020, 1, 3), date(2020, 1, 4))]
+
+
+def test_scraped_through_date(db):
+    twitter_facade.mark_period_scraped('x', date(2020, 1, 1), date(2020, 1, 10))
+    twitter_facade.mark_period_scraped('x', date(2020, 1, 12), date(2020, 1, 20))
+    assert twitter_facade.get_scraped_through_date('x', date(2020, 1, 5)) == date(2020, 1, 10)
+    assert twitter_facade.get_scraped_through_date('x', date(2020, 1, 11)) is None
+    assert twitter_facade.get_scraped_through_date('x', date(2020, 1, 20)) == date(2020, 1, 20)
@@ -0,0 +1,27 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_high_water_marks.py
+# md
+# --------------------------------------------------------------------------------------------------------
+from datetime import datetime
+
+from scraper.database import twitter_facade
+
+"""
+Runs the high-water mark backfill of scraper/database/twitter_facade.py against stubbed queries, so no database is needed.
+"""
+
+
+def test_backfill_only_the_users_without_mark(monkeypatch):
+    marks = {'a': (datetime(2020, 1, 1), '1')}
+    tweets = {'a': (datetime(2020, 2, 1), '2'), 'b': (datetime(2020, 3, 1), '3')}
+
+    def q_get_newest_tweets(usernames):
+        return [{'username': username, 'datetime': tweets[username][0], 'tweet_id': tweets[username][1]} for username in usernames if username in tweets]
+
+    monkeypatch.setattr(twitter_facade, 'q_get_usernames_without_high_water_mark', lambda: [u for u in ['a', 'b', 'c'] if u not in marks])
+    monkeypatch.setattr(twitter_facade, 'q_get_newest_tweets', q_get_newest_tweets)
+    monkeypatch.setattr(twitter_facade, 'q_update_high_water_mark', lambda username, hwm_datetime, hwm_tweet_id: marks.update({username: (hwm_datetime, hwm_tweet_id)}))
+    assert twitter_facade.backfill_high_water_marks() == 1
+    assert marks == {'a': (datetime(2020, 1, 1), '1'), 'b': (datetime(2020, 3, 1), '3')}
+    assert twitter_facade.backfill_high_water_marks() == 0
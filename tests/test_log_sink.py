@@ -0,0 +1,68 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_log_sink.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import pytest
+from pymongo.errors import BulkWriteError
+
+from scraper.database import log_facade
+
+"""
+Runs the _LogSink of scraper/database/log_facade.py against a stubbed q_save_logs, so no database is needed.
+"""
+
+
+class _Written(list):
+    # The written logs. 'errors': the errors the next writes raise, one per write.
+    errors = []
+
+
+@pytest.fixture
+def written(monkeypatch):
+    written = _Written()
+    written.errors = []
+
+    def q_save_logs(logs):
+        if written.errors:
+            error = written.errors.pop(0)
+            if isinstance(error, BulkWriteError):
+                failed = {e['index'] for e in error.details['writeErrors']}
+                written.extend(log for i, log in enumerate(logs) if i not in failed)
+            raise error
+        written.extend(logs)
+
+    monkeypatch.setattr(log_facade, 'q_save_logs', q_save_logs)
+    monkeypatch.setattr(log_facade.time, 'sleep', lambda seconds: None)
+    return written
+
+
+def _log(i, flag='ok'):
+    return {'i': i, 'flag': flag}
+
+
+def test_dead_log_waits_until_written(written):
+    sink = log_facade._LogSink()
+    sink.put(_log(0))
+    written.errors = [ConnectionError(), ConnectionError()]
+    sink.put(_log(1, 'dead'))  # Doesn't raise
+    assert [log['i'] for log in written] == [0, 1]
+
+
+def test_partial_write_keeps_only_the_failed_logs(written):
+    sink = log_facade._LogSink()
+    sink.put(_log(0))
+    sink.put(_log(1))
+    sink.put(_log(2))
+    written.errors = [BulkWriteError({'writeErrors': [{'index': 1, 'code': 1, 'errmsg': 'x'}]})]
+    assert not sink.flush()
+    assert sink.flush()
+    assert [log['i'] for log in written] == [0, 2, 1]
+
+
+def test_partly_failed_dead_log_is_retried(written):
+    sink = log_facade._LogSink()
+    sink.put(_log(0))
+    written.errors = [BulkWriteError({'writeErrors': [{'index': 1, 'code': 1, 'errmsg': 'x'}]})]
+    sink.put(_log(1, 'dead'))
+    assert [log['i'] for log in written] == [0, 1]
@@ -0,0 +1,87 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_proxy_pool.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import time
+
+from scraper.business.proxy_pool import ProxyPool
+
+"""
+Runs the Thompson sampling of scraper/business/proxy_pool.py without a database.
+"""
+
+
+def _pool(proxies):
+    pool = ProxyPool(lambda: proxies, rate=1000, burst=1000)
+    asyncio.run(pool.populate())
+    for arm in pool._arms.values():
+        arm.sample = lambda: 1  # Only the latency counts
+    return pool
+
+
+def _scrape(pool, ip, duration, task, n_units=1):
+    lease = pool._lease((ip, '80'))
+    pool.release(lease, duration=duration, task=task, n_units=n_units)
+
+
+def test_durations_are_compared_per_unit():
+    pool = _pool([{'ip': 'a', 'port': '80'}, {'ip': 'b', 'port': '80'}])
+    _scrape(pool, 'a', 10, 'tweets', n_units=10)  # 1 s per page
+    _scrape(pool, 'b', 2, 'tweets', n_units=1)  # 2 s per page
+    assert pool._thompson_score(('a', '80')) > pool._thompson_score(('b', '80'))
+
+
+def test_durations_are_compared_per_task():
+    pool = _pool([{'ip': 'a', 'port': '80'}, {'ip': 'b', 'port': '80'}])
+    _scrape(pool, 'a', 1, 'profile')
+    _scrape(pool, 'b', 1, 'profile')
+    _scrape(pool, 'b', 10, 'tweets')  # Slower than the profile, but the only tweets scrape
+    assert pool._thompson_score(('a', '80')) == pool._thompson_score(('b', '80'))
+
+
+def test_tested_delay_without_durations():
+    pool = _pool([{'ip': 'a', 'port': '80', 'delay': .1}, {'ip': 'b', 'port': '80', 'delay': .5}])
+    assert pool._thompson_score(('a', '80')) > pool._thompson_score(('b', '80'))
+
+
+def test_expired_lease_isnt_a_fail():
+    pool = _pool([{'ip': 'a', 'port': '80'}])
+    lease = pool._lease(('a', '80'))
+    lease.expires = 0
+    pool._expire_leases()
+    arm = pool._arms[('a', '80')]
+    assert (pool._holders[('a', '80')], arm.alpha, arm.beta) == (0, 1, 1)
+    pool.release(lease, duration=1, task='tweets')  # The scrape ends after all, its success counts
+    assert (pool._holders[('a', '80')], arm.alpha, arm.beta) == (0, 2, 1)
+    pool.release(lease, ok=False)  # A lease is released once
+    assert (arm.alpha, arm.beta) == (2, 1)
+
+
+def test_renewing_keeps_the_lease():
+    pool = ProxyPool(lambda: [{'ip': 'a', 'port': '80'}], lease_time=.1)
+
+    async def scrape():
+        await pool.populate()
+        lease = await pool.acquire()
+        async with pool.renewing(lease):
+            await asyncio.sleep(.3)
+            pool._expire_leases()
+            return lease.lease_id in pool._leases
+
+    assert asyncio.run(scrape())
+
+
+def test_tokens_are_taken_per_request():
+    pool = ProxyPool(lambda: [{'ip': 'a', 'port': '80'}], rate=10, burst=1)
+
+    async def scrape():
+        await pool.populate()
+        lease = await pool.acquire()  # Leasing takes no token
+        start = time.monotonic()
+        for _ in range(4):
+            await pool.wait_for_token(lease)
+        return time.monotonic() - start
+
+    assert .25 <= asyncio.run(scrape()) < 1  # 1 token in the bucket, then 1 per .1 s
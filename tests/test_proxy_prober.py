@@ -0,0 +1,69 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_proxy_prober.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import socket
+
+from scraper.business.proxy_prober import ProxyProber
+
+"""
+Runs the ProxyProber against local asyncio servers that stand in for proxies, so no network is needed.
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _probe(answer, method='CONNECT', port=None):
+    # answer: the status line the stand-in proxy answers, or None for a proxy that doesn't answer
+    async def handle(reader, writer):
+        await reader.readline()
+        if answer is None:
+            await asyncio.sleep(1)  # Longer than the timeout
+        else:
+            writer.write(answer)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    proxy_port = port or server.sockets[0].getsockname()[1]
+    async with server:
+        prober = ProxyProber(target='127.0.0.1:8000', method=method, timeout=.5, concurrency=10)
+        proxy_tests = await prober.probe_async([{'ip': '127.0.0.1', 'port': str(proxy_port)}])
+    return proxy_tests[0]
+
+
+def test_connect_200_is_ok():
+    proxy_test = asyncio.run(_probe(b'HTTP/1.1 200 Connection established\r\n\r\n'))
+    assert (proxy_test['blacklisted'], proxy_test['error_code']) == (False, 0)
+    assert proxy_test['delay'] > 0
+
+
+def test_get_redirect_is_ok():
+    proxy_test = asyncio.run(_probe(b'HTTP/1.1 301 Moved Permanently\r\n\r\n', method='GET'))
+    assert (proxy_test['blacklisted'], proxy_test['error_code']) == (False, 0)
+
+
+def test_forbidden_is_a_bad_answer():
+    proxy_test = asyncio.run(_probe(b'HTTP/1.1 403 Forbidden\r\n\r\n'))
+    assert (proxy_test['blacklisted'], proxy_test['error_code'], proxy_test['delay']) == (True, 1, 0)
+
+
+def test_silent_proxy_times_out():
+    proxy_test = asyncio.run(_probe(None))
+    assert (proxy_test['blacklisted'], proxy_test['error_code']) == (True, 2)
+
+
+def test_refused_connection():
+    proxy_test = asyncio.run(_probe(b'', port=_free_port()))
+    assert (proxy_test['blacklisted'], proxy_test['error_code']) == (True, 3)
+
+
+def test_invalid_port():
+    proxy_test = asyncio.run(_probe(b'', port='http'))
+    assert (proxy_test['blacklisted'], proxy_test['error_code']) == (True, 3)
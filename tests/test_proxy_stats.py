@@ -0,0 +1,54 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_proxy_stats.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import pytest
+from pymongo.errors import BulkWriteError
+
+from scraper.database import proxy_facade
+
+"""
+Runs the _ProxyStatsAggregator of scraper/database/proxy_facade.py against a stubbed q_update_proxies_stats, so no database is needed.
+"""
+
+
+@pytest.fixture
+def written(monkeypatch):
+    # written: the stats of every successful write. Set written.error to make the next write raise it.
+    class _Written(list):
+        error = None
+
+    written = _Written()
+
+    def q_update_proxies_stats(proxies_stats):
+        error, written.error = written.error, None
+        if error: raise error
+        written.append({(stats['ip'], stats['port']): dict(stats['inc']) for stats in proxies_stats})
+
+    monkeypatch.setattr(proxy_facade, 'q_update_proxies_stats', q_update_proxies_stats)
+    return written
+
+
+a, b = {'ip': 'a', 'port': '80'}, {'ip': 'b', 'port': '80'}
+
+
+def test_failed_flush_keeps_the_counters(written):
+    aggregator = proxy_facade._ProxyStatsAggregator()
+    aggregator.add('ok', a)
+    written.error = ConnectionError()
+    aggregator.flush()
+    aggregator.add('TimeoutError', a)
+    aggregator.flush()
+    assert written == [{('a', '80'): {'scrape_n_used': 2, 'scrape_n_used_total': 2, 'flag_stats.ok': 1, 'flag_stats.TimeoutError': 1,
+                                      'scrape_n_failed': 1, 'scrape_n_failed_total': 1}}]
+
+
+def test_partly_failed_flush_keeps_only_the_failed_counters(written):
+    aggregator = proxy_facade._ProxyStatsAggregator()
+    aggregator.add('ok', a)
+    aggregator.add('ok', b)
+    written.error = BulkWriteError({'writeErrors': [{'index': 1, 'code': 1, 'errmsg': 'x'}]})
+    aggregator.flush()
+    aggregator.flush()
+    assert written == [{('b', '80'): {'scrape_n_used': 1, 'scrape_n_used_total': 1, 'flag_stats.ok': 1}}]
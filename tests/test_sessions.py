@@ -0,0 +1,40 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_sessions.py
+# md
+# --------------------------------------------------------------------------------------------------------
+from datetime import date, datetime
+
+from scraper.database import log_facade
+
+"""
+Runs the session functions of scraper/database/log_facade.py against stubbed queries, so no database is needed.
+"""
+
+
+def test_unplanned_session_users(monkeypatch):
+    sessions = {}
+
+    def q_save_session_plan(session_id, plan):
+        sessions[session_id] = {'_id': session_id, 'plan': plan, 'planned_usernames': []}
+
+    def q_add_planned_usernames(session_id, usernames):
+        sessions[session_id]['planned_usernames'].extend(u for u in usernames if u not in sessions[session_id]['planned_usernames'])
+
+    monkeypatch.setattr(log_facade, 'q_save_session_plan', q_save_session_plan)
+    monkeypatch.setattr(log_facade, 'q_add_planned_usernames', q_add_planned_usernames)
+    monkeypatch.setattr(log_facade, 'q_get_session', sessions.get)
+
+    log_facade.save_session_plan(1, [('a', date(2020, 1, 1), date(2020, 12, 31)), ('b', date(2020, 1, 1), date(2020, 12, 31))])
+    assert isinstance(sessions[1]['plan'][0]['begin_date'], datetime)  # bson has no dates
+    log_facade.session_user_planned(1, 'a')
+    assert log_facade.get_unplanned_session_users(1) == [('b', date(2020, 1, 1), date(2020, 12, 31))]
+    assert log_facade.get_unplanned_session_users(2) == []
+
+
+def test_last_ended_session_falls_back_on_the_logs(monkeypatch):
+    monkeypatch.setattr(log_facade, 'q_get_last_ended_session_id', lambda: 7)
+    monkeypatch.setattr(log_facade, 'q_get_max_sesion_id', lambda: 3)
+    assert log_facade.get_last_ended_session_id() == 7
+    monkeypatch.setattr(log_facade, 'q_get_last_ended_session_id', lambda: None)
+    assert log_facade.get_last_ended_session_id() == 3
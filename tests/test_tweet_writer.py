@@ -0,0 +1,60 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_tweet_writer.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import threading
+
+import pandas as pd
+import pytest
+
+from scraper.business import tweet_writer
+
+"""
+Runs the TweetWriter with a stubbed save_tweets, so no database is needed.
+"""
+
+
+class _Saved(list):
+    # The sizes of the saved batches. 'errors': the nr of errors save_tweets returns.
+    errors = 0
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = _Saved()
+
+    def save_tweets(tweets_df):
+        saved.append(len(tweets_df))
+        return {'upserted': len(tweets_df) - saved.errors, 'modified': 0, 'errors': saved.errors}
+
+    monkeypatch.setattr(tweet_writer, 'save_tweets', save_tweets)
+    return saved
+
+
+def _write(n_tweets_per_period, on_saved=None):
+    # Returns the items on_saved got, per batch
+    batches = []
+    writer = tweet_writer.TweetWriter(flush_interval=60, on_saved=on_saved or batches.append)
+    writer.start()
+    for i, n_tweets in enumerate(n_tweets_per_period):
+        writer.put(pd.DataFrame({'id': range(n_tweets)}), i)
+    writer.close()
+    return batches
+
+
+def test_on_saved_gets_the_items_of_the_batch(saved):
+    assert _write([2, 3]) == [[0, 1]]
+    assert saved == [5]
+
+
+def test_on_saved_skipped_on_write_errors(saved):
+    saved.errors = 1
+    assert _write([2, 3]) == []
+    assert saved == [5]
+
+
+def test_on_saved_runs_off_the_writer_thread(saved):
+    threads = []
+    _write([2], on_saved=lambda items: threads.append(threading.current_thread().name))
+    assert len(threads) == 1 and threads[0].startswith('TweetWriterOnSaved')
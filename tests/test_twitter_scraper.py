@@ -0,0 +1,154 @@
+# --------------------------------------------------------------------------------------------------------
+# 2026/10/18
+# src - test_twitter_scraper.py
+# md
+# --------------------------------------------------------------------------------------------------------
+import asyncio
+import importlib
+import sys
+import types
+from datetime import date
+
+import pytest
+
+"""
+Runs the scrapers of scraper/business/twitter_scraper.py against a stubbed twint, so no network or Twitter is needed.
+"""
+
+
+class _Config:
+    def __init__(self):
+        self.Username = None
+        self.User_id = None
+        self.Search = None
+        self.Since = None
+        self.Until = None
+        self.Proxy_host = None
+        self.Proxy_port = None
+        self.Proxy_type = None
+
+
+class _User:
+    def __init__(self, username):
+        self.id = '1'
+        self.name = username.title()
+        self.username = username
+        self.bio = ''
+        self.url = ''
+        self.join_date = '1 Jan 2010'
+        self.join_time = '1:00 PM'
+        self.tweets = 10
+        self.location = ''
+        self.following = 1
+        self.followers = 2
+        self.likes = 3
+        self.media_count = 4
+        self.is_private = 0
+        self.is_verified = 0
+        self.avatar = ''
+        self.background_image = ''
+
+
+class _Session:
+    # Stands in for the aiohttp.ClientSession of twint.get.Request
+    def __init__(self, stub):
+        self.stub = stub
+
+    def get(self, url, ssl=True, params=None, proxy=None):
+        return _Response(self.stub, url, proxy)
+
+
+class _Response:
+    def __init__(self, stub, url, proxy):
+        self.stub, self.url, self.proxy = stub, url, proxy
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def text(self):
+        await asyncio.sleep(.01)  # Let the other scrapes run in between
+        self.stub.requests.append((self.url, self.proxy))
+        if self.url not in self.stub.pages: raise ValueError(f'No page {self.url}')
+        return self.stub.pages[self.url]
+
+
+@pytest.fixture
+def stub_twint(monkeypatch):
+    # stub.pages: url: html, stub.requests: the requested (url, proxy)'s
+    stub = types.SimpleNamespace(pages={}, requests=[])
+
+    async def request(url, connector=None, params=[], headers=[]):
+        return await twint_get.Response(_Session(stub), url, params)
+
+    twint = types.ModuleType('twint')
+    twint_get = types.ModuleType('twint.get')
+    twint_user = types.ModuleType('twint.user')
+    twint_run = types.ModuleType('twint.run')
+    twint.Config = _Config
+    twint.get, twint.user, twint.run = twint_get, twint_user, twint_run
+    twint_get.Request = request
+    twint_get.get_connector = lambda config: None
+    twint_user.User = lambda soup: _User(str(soup))
+    for name, module in [('twint', twint), ('twint.get', twint_get), ('twint.user', twint_user), ('twint.run', twint_run)]:
+        monkeypatch.setitem(sys.modules, name, module)
+    try:
+        import bs4
+    except ImportError:
+        monkeypatch.setitem(sys.modules, 'bs4', types.SimpleNamespace(BeautifulSoup=lambda markup, features: markup))
+    monkeypatch.delitem(sys.modules, 'scraper.business.twitter_scraper', raising=False)
+    stub.module = importlib.import_module('scraper.business.twitter_scraper')
+    yield stub
+    sys.modules.pop('scraper.business.twitter_scraper', None)
+
+
+def test_profile_lookup_returns_the_profile(stub_twint):
+    stub_twint.pages['https://twitter.com/someuser?lang=en'] = 'someuser'
+    scraper = stub_twint.module.ProfileScraper({})
+    profile_df = asyncio.run(asyncio.wait_for(scraper.execute_scraping_async('someuser', proxy_server={'ip': '1.2.3.4', 'port': '80'}), 5))
+    assert stub_twint.requests == [('https://twitter.com/someuser?lang=en', 'http://1.2.3.4:80')]
+    assert list(profile_df['username']) == ['someuser']
+    assert profile_df.loc[0, 'join_datetime'] == '1 Jan 2010 1:00 PM'
+
+
+def test_profile_lookup_failure_returns_empty_df(stub_twint):
+    scraper = stub_twint.module.ProfileScraper({})
+    profile_df = asyncio.run(asyncio.wait_for(scraper.execute_scraping_async('missing'), 5))
+    assert profile_df.empty
+
+
+def test_concurrent_scrapes_use_their_own_proxy(stub_twint):
+    usernames = [f'user{i}' for i in range(5)]
+    for username in usernames:
+        stub_twint.pages[f'https://twitter.com/{username}?lang=en'] = username
+    scraper = stub_twint.module.ProfileScraper({})
+
+    async def scrape_all():
+        return await asyncio.gather(*[scraper.execute_scraping_async(username, proxy_server={'ip': f'10.0.0.{i}', 'port': '80'})
+                                      for i, username in enumerate(usernames)])
+
+    profile_dfs = asyncio.run(asyncio.wait_for(scrape_all(), 5))
+    assert [df.loc[0, 'username'] for df in profile_dfs] == usernames
+    assert sorted(stub_twint.requests) == [(f'https://twitter.com/user{i}?lang=en', f'http://10.0.0.{i}:80') for i in range(5)]
+
+
+def test_tweets_period_includes_its_end_date(stub_twint):
+    scraper = stub_twint.module.TweetScraper({})
+    c = scraper._make_call_config('someuser', date(2020, 1, 1), date(2020, 1, 31), None)
+    assert (c.Since, c.Until) == ('2020-01-01', '2020-02-01')
+    c = scraper._make_call_config('someuser', date(2020, 1, 1), date(2020, 1, 1), None)
+    assert (c.Since, c.Until) == ('2020-01-01', '2020-01-02')
+
+
+def test_throttle_is_awaited_per_request(stub_twint):
+    stub_twint.pages['https://twitter.com/someuser?lang=en'] = 'someuser'
+    n_throttled = []
+
+    async def throttle():
+        n_throttled.append(1)
+
+    scraper = stub_twint.module.ProfileScraper({})
+    asyncio.run(scraper.execute_scraping_async('someuser', throttle=throttle))
+    assert len(n_throttled) == len(stub_twint.requests) == 1